@@ -1,61 +1,29 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 import gspread
-from google.oauth2.service_account import Credentials
 import io
 import os
+from nucleo_rh import (
+    HOJAS_DATOS, SPREADSHEET_NAME, DIAS_ECONOMICOS_ANUALES, LIMITE_ART44, UMBRAL_PRECAUCION_ART44, NORMATIVA,
+    TTL_CACHE_SEGUNDOS, CUOTA_LECTURAS_POR_MINUTO, CUOTA_ESCRITURAS_POR_MINUTO, CARPETA_INSTANTANEAS,
+    INTERVALO_REVISION_SEGUNDOS, AlmacenDatos, InstantaneasDisco, PlanificadorSheets, PoolHojas, ColaEscrituras,
+    DetectorCambios,
+    AlmacenamientoSheets, AlmacenamientoSQLite, copiar_hojas, conectar_con_credenciales, normalizar_hoja,
+    calcular_saldos, conciliar_dias_disponibles, validar_solicitud, IndiceLicencias, OcupacionDiaria, IndiceIntervalos,
+    acumular_incapacidades, reporte_riesgo_art44, dias_por_mes, pendientes_por_empleado, resumen_pendientes,
+    generar_reporte_completo_mes, crear_trazabilidad_completa, generar_alertas, verificar_fechas_limite,
+    IndiceBusqueda, DirectorioEmpleados
+)
 
 st.set_page_config(page_title="Sistema de Gestión de RH DFC", page_icon="📅", layout="wide")
 
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-
-NORMATIVA = {
-    'economico': {
-        'nombre': 'Día Económico', 
-        'max_dias': 3, 
-        'max_ocasiones': 3, 
-        'intervalo_dias': 30, 
-        'descripcion': 'Hasta 3 ocasiones por año',
-        'limite': '3 ocasiones/año'
-    },
-    'matrimonio': {
-        'nombre': 'Matrimonio', 
-        'max_dias': 10, 
-        'max_ocasiones': 1, 
-        'descripcion': 'Por una sola ocasión en la vida',
-        'limite': '1 vez en la vida'
-    },
-    'fallecimiento': {
-        'nombre': 'Fallecimiento/Enfermedad Grave', 
-        'max_dias': 5, 
-        'descripcion': 'Parientes primer grado',
-        'limite': 'Sin límite'
-    },
-    'jubilacion': {
-        'nombre': 'Trámites Jubilación', 
-        'max_dias': 2, 
-        'descripcion': 'Solo cuando se jubila',
-        'limite': '1 vez en la vida'
-    },
-    'examen': {
-        'nombre': 'Examen Profesional/Tesis', 
-        'max_dias': 3, 
-        'descripcion': 'Presentación de grado',
-        'limite': 'Máximo 3 veces'
-    },
-    'mudanza': {
-        'nombre': 'Cambio de Domicilio', 
-        'max_dias': 1, 
-        'descripcion': 'Para mudanza',
-        'limite': '2 veces/año'
-    }
-}
+# Empleados por página en Estatus Individual
+EMPLEADOS_POR_PAGINA = 20
 
 def conectar_sheets():
     try:
-        creds = Credentials.from_service_account_info(st.secrets["google_sheets"], scopes=SCOPES)
-        return gspread.authorize(creds)
+        return conectar_con_credenciales(st.secrets["google_sheets"])
     except:
         return None
 
@@ -71,7 +39,7 @@ def verificar_login(usuario, password):
 
 def inicializar_sheets(client):
     try:
-        spreadsheet = client.open("Dias_Economicos_Formacion_Continua")
+        spreadsheet = client.open(SPREADSHEET_NAME)
         sheet_empleados = spreadsheet.worksheet("Empleados")
         sheet_solicitudes = spreadsheet.worksheet("Solicitudes")
         
@@ -117,374 +85,83 @@ def inicializar_sheets(client):
         st.code(traceback.format_exc())
         return None, None, None, None, None, None
 
-def cargar_datos_con_calculo(sheet_emp, sheet_sol):
-    """Carga datos y CALCULA días disponibles en tiempo real"""
-    df_emp = pd.DataFrame(sheet_emp.get_all_records())
-    df_sol = pd.DataFrame(sheet_sol.get_all_records())
-    
-    # CALCULAR DÍAS DISPONIBLES REALES
-    for idx, emp in df_emp.iterrows():
-        emp_id = emp['ID']
-        
-        # Contar días económicos usados este año
-        solicitudes_emp = df_sol[
-            (df_sol['EmpleadoID'] == emp_id) & 
-            (df_sol['Tipo Permiso'] == 'economico')
-        ]
-        
-        dias_usados = 0
-        if len(solicitudes_emp) > 0:
-            solicitudes_emp['Fecha_Reg'] = pd.to_datetime(solicitudes_emp['Fecha Registro'], errors='coerce')
-            solicitudes_año = solicitudes_emp[solicitudes_emp['Fecha_Reg'].dt.year == datetime.now().year]
-            dias_usados = int(solicitudes_año['Dias Solicitados'].sum())
-        
-        df_emp.at[idx, 'DIAS_REALES'] = 9 - dias_usados
-    
-    return df_emp, df_sol
+def leer_configuracion(seccion, clave, por_defecto, tipo=int):
+    """Valor opcional de st.secrets[seccion][clave] (numérico salvo que se indique otro tipo)"""
+    try:
+        return tipo(st.secrets[seccion][clave])
+    except:
+        return por_defecto
 
-def validar_solicitud(emp_id, tipo, dias, fecha_inicio, df_emp, df_sol):
-    """Validación completa de solicitud"""
-    errores = []
-    advertencias = []
-    
-    emp_info = df_emp[df_emp['ID'] == emp_id].iloc[0]
-    dias_disponibles = int(emp_info['DIAS_REALES'])
-    config = NORMATIVA[tipo]
-    
-    # Validar días máximos
-    if dias > config['max_dias']:
-        errores.append(f"❌ Máximo permitido: {config['max_dias']} días")
-    
-    if tipo == 'economico':
-        # Validar días disponibles
-        if dias > dias_disponibles:
-            errores.append(f"❌ Solo tiene {dias_disponibles} días disponibles (solicitó {dias})")
-        
-        # Validar ocasiones en el año
-        año_actual = datetime.now().year
-        solicitudes_eco = df_sol[
-            (df_sol['EmpleadoID'] == emp_id) &
-            (df_sol['Tipo Permiso'] == 'economico')
-        ]
-        
-        if len(solicitudes_eco) > 0:
-            solicitudes_eco['Fecha_Reg'] = pd.to_datetime(solicitudes_eco['Fecha Registro'], errors='coerce')
-            solicitudes_año = solicitudes_eco[solicitudes_eco['Fecha_Reg'].dt.year == año_actual]
-            
-            if len(solicitudes_año) >= config['max_ocasiones']:
-                errores.append(f"❌ Ya alcanzó el límite de {config['max_ocasiones']} ocasiones en el año")
-            
-            # Validar intervalo 30 días
-            if len(solicitudes_eco) > 0:
-                solicitudes_eco['Fecha_Fin'] = pd.to_datetime(solicitudes_eco['Fecha Fin'], errors='coerce')
-                ultima_fecha_fin = solicitudes_eco['Fecha_Fin'].max()
-                fecha_inicio_dt = pd.to_datetime(fecha_inicio)
-                dias_diferencia = (fecha_inicio_dt - ultima_fecha_fin).days
-                
-                if dias_diferencia < 30:
-                    fecha_valida = ultima_fecha_fin + timedelta(days=30)
-                    errores.append(
-                        f"❌ Debe esperar {30 - dias_diferencia} días más\n"
-                        f"   Último día usado: {ultima_fecha_fin.strftime('%d/%m/%Y')}\n"
-                        f"   Puede solicitar desde: {fecha_valida.strftime('%d/%m/%Y')}"
-                    )
-        
-        # Advertencia
-        if dias_disponibles - dias <= 2 and dias <= dias_disponibles:
-            advertencias.append(f"⚠️ Después quedarán {dias_disponibles - dias} días disponibles")
-    
-    # Matrimonio solo una vez EN LA VIDA
-    if tipo == 'matrimonio':
-        solicitudes_mat = df_sol[
-            (df_sol['EmpleadoID'] == emp_id) &
-            (df_sol['Tipo Permiso'] == 'matrimonio')
-        ]
-        if len(solicitudes_mat) > 0:
-            errores.append("❌ La licencia por matrimonio solo se otorga UNA VEZ en la vida")
-    
-    # Jubilación solo una vez EN LA VIDA
-    if tipo == 'jubilacion':
-        solicitudes_jub = df_sol[
-            (df_sol['EmpleadoID'] == emp_id) &
-            (df_sol['Tipo Permiso'] == 'jubilacion')
-        ]
-        if len(solicitudes_jub) > 0:
-            errores.append("❌ La licencia por jubilación solo se otorga UNA VEZ (cuando se jubila)")
-    
-    # Examen profesional: máximo 3 veces en la vida (licenciatura, maestría, doctorado)
-    if tipo == 'examen':
-        solicitudes_exam = df_sol[
-            (df_sol['EmpleadoID'] == emp_id) &
-            (df_sol['Tipo Permiso'] == 'examen')
-        ]
-        if len(solicitudes_exam) >= 3:
-            errores.append("❌ La licencia por examen profesional se otorga máximo 3 veces (licenciatura, maestría, doctorado)")
-    
-    # Mudanza: máximo 2 veces por año (razonable)
-    if tipo == 'mudanza':
-        año_actual = datetime.now().year
-        solicitudes_mud = df_sol[
-            (df_sol['EmpleadoID'] == emp_id) &
-            (df_sol['Tipo Permiso'] == 'mudanza')
-        ]
-        if len(solicitudes_mud) > 0:
-            solicitudes_mud['Fecha_Reg'] = pd.to_datetime(solicitudes_mud['Fecha Registro'], errors='coerce')
-            solicitudes_año = solicitudes_mud[solicitudes_mud['Fecha_Reg'].dt.year == año_actual]
-            if len(solicitudes_año) >= 2:
-                errores.append("❌ La licencia por mudanza se otorga máximo 2 veces por año")
-    
-    return errores, advertencias
+@st.cache_resource
+def obtener_almacen():
+    compacto = bool(leer_configuracion('cache', 'compacto', 1))
+    # Instantáneas Parquet en disco; con instantaneas = "" en [cache] se desactivan
+    carpeta = leer_configuracion('cache', 'instantaneas', CARPETA_INSTANTANEAS, tipo=str)
+    return AlmacenDatos(ttl_segundos=leer_configuracion('cache', 'ttl_segundos', TTL_CACHE_SEGUNDOS),
+                        normalizar=lambda nombre, df: normalizar_hoja(nombre, df, compacto=compacto),
+                        instantaneas=InstantaneasDisco(carpeta) if carpeta else None)
 
-def generar_reporte_completo_mes(df_emp, df_sol, df_incap, df_pend, mes, año):
-    """Genera un Excel completo con TODO el mes"""
-    output = io.BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Filtrar datos del mes
-        df_sol_mes = df_sol.copy()
-        if len(df_sol_mes) > 0:
-            df_sol_mes['Fecha_Reg'] = pd.to_datetime(df_sol_mes['Fecha Registro'], errors='coerce')
-            df_sol_mes = df_sol_mes[
-                (df_sol_mes['Fecha_Reg'].dt.month == mes) & 
-                (df_sol_mes['Fecha_Reg'].dt.year == año)
-            ]
-        
-        df_incap_mes = df_incap.copy()
-        if len(df_incap_mes) > 0 and 'Fecha Inicio' in df_incap_mes.columns:
-            df_incap_mes['Fecha_Inicio_dt'] = pd.to_datetime(df_incap_mes['Fecha Inicio'], errors='coerce')
-            df_incap_mes = df_incap_mes[
-                (df_incap_mes['Fecha_Inicio_dt'].dt.month == mes) & 
-                (df_incap_mes['Fecha_Inicio_dt'].dt.year == año)
-            ]
-        
-        df_pend_mes = df_pend.copy()
-        if len(df_pend_mes) > 0 and 'Fecha_Registro' in df_pend_mes.columns:
-            df_pend_mes['Fecha_Reg_dt'] = pd.to_datetime(df_pend_mes['Fecha_Registro'], errors='coerce')
-            df_pend_mes = df_pend_mes[
-                (df_pend_mes['Fecha_Reg_dt'].dt.month == mes) & 
-                (df_pend_mes['Fecha_Reg_dt'].dt.year == año)
-            ]
-        
-        # HOJA 1: RESUMEN EJECUTIVO
-        resumen_data = {
-            'INDICADOR': [
-                'Total Solicitudes del Mes',
-                'Total Incapacidades del Mes',
-                'Total Pendientes Registrados',
-                'Días Económicos Solicitados',
-                'Otros Permisos Solicitados',
-                'Total Días Solicitados',
-                'Empleados que Solicitaron',
-                'Pendientes Activos'
-            ],
-            'VALOR': [
-                len(df_sol_mes),
-                len(df_incap_mes),
-                len(df_pend_mes),
-                len(df_sol_mes[df_sol_mes['Tipo Permiso'] == 'economico']) if len(df_sol_mes) > 0 else 0,
-                len(df_sol_mes[df_sol_mes['Tipo Permiso'] != 'economico']) if len(df_sol_mes) > 0 else 0,
-                df_sol_mes['Dias Solicitados'].sum() if len(df_sol_mes) > 0 else 0,
-                df_sol_mes['EmpleadoID'].nunique() if len(df_sol_mes) > 0 else 0,
-                len(df_pend_mes[df_pend_mes['Estado'] == 'Pendiente']) if len(df_pend_mes) > 0 else 0
-            ]
-        }
-        df_resumen = pd.DataFrame(resumen_data)
-        df_resumen.to_excel(writer, sheet_name='RESUMEN', index=False)
-        
-        # HOJA 2: SOLICITUDES DEL MES
-        if len(df_sol_mes) > 0:
-            df_sol_export = df_sol_mes[[
-                'ID', 'EmpleadoID', 'RFC', 'Nombre Completo',
-                'Tipo Permiso', 'Fecha Inicio', 'Fecha Fin', 'Dias Solicitados',
-                'Motivo', 'Fecha Registro', 'Aprobado Por', 'Registrado Por'
-            ]].copy()
-            df_sol_export.to_excel(writer, sheet_name='Solicitudes', index=False)
-        
-        # HOJA 3: INCAPACIDADES DEL MES
-        if len(df_incap_mes) > 0:
-            df_incap_export = df_incap_mes.drop(columns=['Fecha_Inicio_dt'], errors='ignore')
-            df_incap_export.to_excel(writer, sheet_name='Incapacidades', index=False)
-        
-        # HOJA 4: PENDIENTES DEL MES
-        if len(df_pend_mes) > 0:
-            df_pend_export = df_pend_mes.drop(columns=['Fecha_Reg_dt'], errors='ignore')
-            df_pend_export.to_excel(writer, sheet_name='Pendientes', index=False)
-        
-        # HOJA 5: ESTADÍSTICAS POR TIPO
-        if len(df_sol_mes) > 0:
-            stats_tipo = df_sol_mes.groupby('Tipo Permiso').agg({
-                'ID': 'count',
-                'Dias Solicitados': 'sum',
-                'EmpleadoID': 'nunique'
-            }).rename(columns={
-                'ID': 'Num Solicitudes',
-                'Dias Solicitados': 'Total Dias',
-                'EmpleadoID': 'Num Empleados'
-            })
-            stats_tipo.to_excel(writer, sheet_name='Stats por Tipo')
-        
-        # HOJA 6: ESTADÍSTICAS POR EMPLEADO
-        if len(df_sol_mes) > 0:
-            stats_emp = df_sol_mes.groupby(['EmpleadoID', 'Nombre Completo']).agg({
-                'ID': 'count',
-                'Dias Solicitados': 'sum'
-            }).rename(columns={
-                'ID': 'Num Solicitudes',
-                'Dias Solicitados': 'Total Dias'
-            })
-            stats_emp.to_excel(writer, sheet_name='Stats por Empleado')
-        
-        # HOJA 7: ESTADO ACTUAL DE EMPLEADOS
-        df_emp_export = df_emp[['ID', 'RFC', 'PATERNO', 'MATERNO', 'NOMBRE', 'CURP', 'PLAZA', 'DIAS_REALES']].copy()
-        df_emp_export.to_excel(writer, sheet_name='Estado Empleados', index=False)
-    
-    output.seek(0)
-    return output.getvalue()
-
-def crear_trazabilidad_completa(df_sol, df_emp):
-    """Crea un reporte de trazabilidad completo"""
-    if len(df_sol) == 0:
-        return pd.DataFrame()
-    
-    df_traz = df_sol.copy()
-    df_traz['Fecha_Reg'] = pd.to_datetime(df_traz['Fecha Registro'], errors='coerce')
-    
-    # Enriquecer con información del empleado
-    df_traz = df_traz.merge(
-        df_emp[['ID', 'PLAZA']],
-        left_on='EmpleadoID',
-        right_on='ID',
-        how='left',
-        suffixes=('', '_emp')
+@st.cache_resource
+def obtener_planificador():
+    return PlanificadorSheets(
+        lecturas_por_minuto=leer_configuracion('cuota', 'lecturas_por_minuto', CUOTA_LECTURAS_POR_MINUTO),
+        escrituras_por_minuto=leer_configuracion('cuota', 'escrituras_por_minuto', CUOTA_ESCRITURAS_POR_MINUTO)
     )
-    
-    # Ordenar cronológicamente
-    df_traz = df_traz.sort_values('Fecha_Reg', ascending=False)
-    
-    # Columnas de trazabilidad
-    columnas_traz = [
-        'Fecha Registro', 'Nombre Completo', 'RFC', 'PLAZA',
-        'Tipo Permiso', 'Fecha Inicio', 'Fecha Fin', 'Dias Solicitados',
-        'Motivo', 'Aprobado Por', 'Registrado Por'
-    ]
-    
-    return df_traz[columnas_traz]
 
-def generar_alertas(df_empleados):
-    """Genera alertas de empleados con pocos días"""
-    alertas = []
-    for _, emp in df_empleados.iterrows():
-        dias = int(emp['DIAS_REALES'])
-        nombre = f"{emp['PATERNO']} {emp['MATERNO']} {emp['NOMBRE']}"
-        
-        if dias == 0:
-            alertas.append({'tipo': 'error', 'mensaje': f"🚫 {nombre} NO tiene días disponibles"})
-        elif dias == 1:
-            alertas.append({'tipo': 'warning', 'mensaje': f"⚠️ {nombre} tiene solo 1 día disponible"})
-        elif dias <= 3:
-            alertas.append({'tipo': 'info', 'mensaje': f"ℹ️ {nombre} tiene {dias} días disponibles"})
-    
-    return alertas
+@st.cache_resource
+def obtener_pool():
+    return PoolHojas(conectar_sheets, obtener_planificador())
 
-def verificar_fechas_limite():
-    """Recordatorios de fechas límite para propuestas"""
-    zona_mexico = timezone(timedelta(hours=-6))
-    hoy = datetime.now(zona_mexico).date()
-    
-    # CALENDARIO ESTATAL
-    fechas_estatal = {
-        'Q03': datetime(2026, 1, 23).date(),
-        'Q04': datetime(2026, 2, 5).date(),
-        'Q05': datetime(2026, 2, 16).date(),
-        'Q06': datetime(2026, 3, 3).date(),
-        'Q07': datetime(2026, 3, 3).date(),
-        'Q08': datetime(2026, 3, 23).date(),
-        'Q09': datetime(2026, 4, 20).date(),
-        'Q10': datetime(2026, 5, 7).date(),
-        'Q11': datetime(2026, 5, 20).date(),
-        'Q12': datetime(2026, 6, 8).date(),
-        'Q13': datetime(2026, 6, 22).date(),
-        'Q14': datetime(2026, 7, 8).date(),
-        'Q15': datetime(2026, 7, 21).date(),
-        'Q16': datetime(2026, 8, 10).date(),
-        'Q17': datetime(2026, 8, 21).date(),
-        'Q18': datetime(2026, 9, 4).date(),
-        'Q19': datetime(2026, 9, 22).date(),
-        'Q20': datetime(2026, 10, 6).date(),
-        'Q21': datetime(2026, 10, 21).date(),
-        'Q22': datetime(2026, 11, 5).date(),
-    }
-    
-    # CALENDARIO FEDERALIZADO
-    fechas_federal = {
-        'Q02': datetime(2026, 1, 9).date(),
-        'Q03': datetime(2026, 1, 23).date(),
-        'Q04': datetime(2026, 2, 5).date(),
-        'Q05': datetime(2026, 2, 19).date(),
-        'Q06': datetime(2026, 3, 6).date(),
-        'Q07': datetime(2026, 3, 6).date(),
-        'Q08': datetime(2026, 4, 7).date(),
-        'Q09': datetime(2026, 4, 23).date(),
-        'Q10': datetime(2026, 5, 7).date(),
-        'Q11': datetime(2026, 5, 22).date(),
-        'Q12': datetime(2026, 6, 8).date(),
-        'Q13': datetime(2026, 6, 23).date(),
-        'Q14': datetime(2026, 6, 23).date(),
-        'Q15': datetime(2026, 6, 23).date(),
-        'Q16': datetime(2026, 8, 6).date(),
-        'Q17': datetime(2026, 8, 21).date(),
-        'Q18': datetime(2026, 9, 7).date(),
-        'Q19': datetime(2026, 9, 22).date(),
-        'Q20': datetime(2026, 10, 7).date(),
-        'Q21': datetime(2026, 10, 22).date(),
-        'Q22': datetime(2026, 11, 5).date(),
-        'Q23': datetime(2026, 11, 20).date(),
-        'Q24': datetime(2026, 11, 20).date(),
-    }
-    
-    alertas = {'criticas': [], 'proximas': [], 'futuras': []}
-    
-    # ESTATAL
-    for qna, fecha in fechas_estatal.items():
-        dias = (fecha - hoy).days
-        if dias < 0:
-            continue
-        
-        item = {
-            'sistema': 'ESTATAL',
-            'quincena': qna,
-            'fecha': fecha.strftime('%d/%m/%Y'),
-            'dias': dias
-        }
-        
-        if 0 <= dias <= 5:
-            alertas['criticas'].append(item)
-        elif 4 <= dias <= 15:
-            alertas['proximas'].append(item)
-        elif 16 <= dias <= 90:
-            alertas['futuras'].append(item)
-    
-    # FEDERALIZADO
-    for qna, fecha in fechas_federal.items():
-        dias = (fecha - hoy).days
-        if dias < 0:
-            continue
-        
-        item = {
-            'sistema': 'FEDERAL',
-            'quincena': qna,
-            'fecha': fecha.strftime('%d/%m/%Y'),
-            'dias': dias
-        }
-        
-        if 0 <= dias <= 5:
-            alertas['criticas'].append(item)
-        elif 4 <= dias <= 15:
-            alertas['proximas'].append(item)
-        elif 16 <= dias <= 90:
-            alertas['futuras'].append(item)
-    
-    return alertas
+@st.cache_resource
+def obtener_almacenamiento():
+    """Almacenamiento principal según st.secrets[almacenamiento][motor]: 'sheets' (por defecto) o 'sqlite'.
+
+    Con SQLite, las hojas que todavía no están en la base se importan de Google
+    Sheets la primera vez; después Sheets solo recibe el espejo (hojas Espejo_<hoja>)
+    que exporta recalculo_nocturno.py.
+    """
+    sheets = AlmacenamientoSheets(obtener_pool())
+    if leer_configuracion('almacenamiento', 'motor', 'sheets', tipo=str) != 'sqlite':
+        return sheets
+    local = AlmacenamientoSQLite(leer_configuracion('almacenamiento', 'ruta', 'rh_dfc.db', tipo=str))
+    faltantes = [nombre for nombre in HOJAS_DATOS if not local.existe(nombre)]
+    if faltantes:
+        copiar_hojas(sheets, local, faltantes)
+    return local
+
+def cargar_hojas(nombres):
+    """Cargador para el almacén: solo lee del almacenamiento si alguna hoja venció.
+
+    Pasa por el detector de cambios para que anote la versión de cada hoja descargada.
+    """
+    return obtener_detector().cargar(nombres)
+
+def revisar_cambios():
+    """Marca como vencidas las hojas que escribieron otras sesiones.
+
+    Va antes y fuera del bloque de carga: si no hay conexión (o no se puede crear
+    el almacenamiento), la carga es la que decide si se sirve la copia en disco.
+    """
+    try:
+        obtener_detector().revisar()
+    except Exception:
+        pass
+
+@st.cache_resource
+def obtener_cola():
+    return ColaEscrituras(obtener_almacenamiento(), obtener_almacen())
+
+@st.cache_resource
+def obtener_detector():
+    return DetectorCambios(obtener_almacenamiento(), obtener_almacen(),
+                           intervalo_segundos=leer_configuracion('cache', 'revision_segundos', INTERVALO_REVISION_SEGUNDOS))
+
+def alternar_empleado_abierto(emp_id):
+    """Abre el detalle de un empleado en Estatus Individual (o lo cierra si ya estaba abierto)"""
+    if st.session_state.get('empleado_abierto') == emp_id:
+        st.session_state['empleado_abierto'] = None
+    else:
+        st.session_state['empleado_abierto'] = emp_id
 
 def generar_constancias_word(df_constancias, empleados_seleccionados, num_quincena, año, fecha_elaboracion):
     """Genera documento Word con constancias conservando formato e imágenes"""
@@ -801,27 +478,22 @@ if tipo_usuario == 'visor_viaticos':
     
     st.markdown("---")
     
-    # Cargar datos
-    if 'df_empleados' not in st.session_state:
-        client = conectar_sheets()
-        if client:
-            spreadsheet = client.open("Dias_Economicos_Formacion_Continua")
-            st.session_state['df_empleados'] = pd.DataFrame(spreadsheet.worksheet("Empleados").get_all_records())
-    
-    df_empleados = st.session_state['df_empleados'].copy()
+    # Cargar datos (instantánea compartida entre sesiones)
+    revisar_cambios()
+    try:
+        almacen = obtener_almacen()
+        datos = almacen.obtener_varias(['Empleados'], cargar_hojas)
+        df_empleados = datos['Empleados']
+        indice_busqueda = almacen.derivado(('busqueda',), datos, ['Empleados'], lambda: IndiceBusqueda(datos['Empleados']))
+    except Exception as e:
+        st.error(f"Error al cargar datos: {str(e)}")
+        st.stop()
     
     # Búsqueda
     busqueda = st.text_input("🔍 Buscar por nombre, RFC o CURP")
     
     if busqueda:
-        mascara = (
-            df_empleados['PATERNO'].str.contains(busqueda, case=False, na=False) |
-            df_empleados['MATERNO'].str.contains(busqueda, case=False, na=False) |
-            df_empleados['NOMBRE'].str.contains(busqueda, case=False, na=False) |
-            df_empleados['RFC'].str.contains(busqueda, case=False, na=False) |
-            df_empleados['CURP'].str.contains(busqueda, case=False, na=False)
-        )
-        df_empleados = df_empleados[mascara]
+        df_empleados = df_empleados.iloc[indice_busqueda.buscar(busqueda)]
     
     st.info(f"📊 Mostrando {len(df_empleados)} empleados")
     
@@ -846,28 +518,22 @@ elif tipo_usuario == 'visor_secretarias':
     
     st.markdown("---")
     
-    # Cargar datos
-    if 'df_empleados' not in st.session_state:
-        client = conectar_sheets()
-        if client:
-            spreadsheet = client.open("Dias_Economicos_Formacion_Continua")
-            st.session_state['df_empleados'] = pd.DataFrame(spreadsheet.worksheet("Empleados").get_all_records())
-    
-    df_empleados = st.session_state['df_empleados'].copy()
+    # Cargar datos (instantánea compartida entre sesiones)
+    revisar_cambios()
+    try:
+        almacen = obtener_almacen()
+        datos = almacen.obtener_varias(['Empleados'], cargar_hojas)
+        df_empleados = datos['Empleados']
+        indice_busqueda = almacen.derivado(('busqueda',), datos, ['Empleados'], lambda: IndiceBusqueda(datos['Empleados']))
+    except Exception as e:
+        st.error(f"Error al cargar datos: {str(e)}")
+        st.stop()
     
     # Búsqueda
     busqueda = st.text_input("🔍 Buscar por nombre, RFC, CURP o Centro de Maestros")
     
     if busqueda:
-        mascara = (
-            df_empleados['PATERNO'].str.contains(busqueda, case=False, na=False) |
-            df_empleados['MATERNO'].str.contains(busqueda, case=False, na=False) |
-            df_empleados['NOMBRE'].str.contains(busqueda, case=False, na=False) |
-            df_empleados['RFC'].str.contains(busqueda, case=False, na=False) |
-            df_empleados['CURP'].str.contains(busqueda, case=False, na=False) |
-            df_empleados.get('CENTRO DE TRABAJO', pd.Series()).str.contains(busqueda, case=False, na=False)
-        )
-        df_empleados = df_empleados[mascara]
+        df_empleados = df_empleados.iloc[indice_busqueda.buscar(busqueda)]
     
     st.info(f"📊 Mostrando {len(df_empleados)} empleados")
     
@@ -910,47 +576,6 @@ with col2:
 
 st.markdown("---")
 
-# CSS para mejorar visibilidad de pestañas
-st.markdown("""
-<style>
-    /* Pestañas normales */
-    .stTabs [data-baseweb="tab"] {
-        height: 60px;
-        padding: 15px 25px;
-        background-color: #f0f2f6;
-        border-radius: 5px 5px 0px 0px;
-        margin-right: 5px;
-        font-weight: 700;
-        font-size: 18px !important;
-        transition: all 0.3s ease;
-    }
-    
-    /* Texto dentro de pestañas más grande */
-    .stTabs [data-baseweb="tab"] p {
-        font-size: 18px !important;
-        font-weight: 700 !important;
-    }
-    
-    /* Hover sobre pestañas */
-    .stTabs [data-baseweb="tab"]:hover {
-        background-color: #e0e5eb;
-        transform: translateY(-2px);
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-    }
-    
-    /* Pestaña activa/seleccionada */
-    .stTabs [aria-selected="true"] {
-        background-color: #0068c9 !important;
-        color: white !important;
-        font-weight: 800 !important;
-        font-size: 19px !important;
-        box-shadow: 0 4px 10px rgba(0,104,201,0.3);
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Cargar datos solo una vez al inicio
-
 # Mostrar alerta de login si hay propuestas críticas
 if st.session_state.get('mostrar_alerta_login', False):
     with st.container():
@@ -967,73 +592,102 @@ if st.session_state.get('mostrar_alerta_login', False):
         
         st.markdown("---")
 
-# Cargar datos solo una vez al inicio
-if 'df_empleados' not in st.session_state:
-    client = conectar_sheets()
-    if client:
-        try:
-            spreadsheet = client.open("Dias_Economicos_Formacion_Continua")
-            
-            # Leer TODAS las hojas y convertir a DataFrames
-            st.session_state['df_empleados'] = pd.DataFrame(spreadsheet.worksheet("Empleados").get_all_records())
-            
-            
-            st.session_state['df_solicitudes'] = pd.DataFrame(spreadsheet.worksheet("Solicitudes").get_all_records())
-            
-            
-            # Incapacidades con columnas por defecto
-            df_incap = pd.DataFrame(spreadsheet.worksheet("Incapacidades").get_all_records())
-           
-            if len(df_incap) == 0:
-                df_incap = pd.DataFrame(columns=['ID', 'EmpleadoID', 'RFC', 'Nombre Completo', 'Correo Empleado',
-                                                  'Telefono Contacto', 'Numero Incapacidad', 'Fecha Inicio', 
-                                                  'Fecha Termino', 'Dias Totales', 'Tipo Incapacidad', 'Excede Dias',
-                                                  'Dias Enfermedad General', 'Dias Maternidad', 'Dias Riesgo Trabajo',
-                                                  'Dias Posible Riesgo', 'Mes Correspondiente', 'Estado', 'Registrado Por'])
-            st.session_state['df_incapacidades'] = df_incap
-            
-            # Pendientes con columnas por defecto
-            df_pend = pd.DataFrame(spreadsheet.worksheet("Pendientes_Empleado").get_all_records())
-            
-            if len(df_pend) == 0:
-                df_pend = pd.DataFrame(columns=['ID', 'EmpleadoID', 'RFC', 'Nombre Completo', 'Tipo_Pendiente',
-                                                'Descripcion', 'Quincena', 'Año', 'Estado', 'Fecha_Registro',
-                                                'Fecha_Completado', 'Completado_Por'])
-            st.session_state['df_pendientes'] = df_pend
-            
-            st.session_state['df_constancias'] = pd.DataFrame(spreadsheet.worksheet("Constancias").get_all_records())
-            # AGREGAR ESTA LÍNEA:
-            st.session_state['df_comisiones'] = pd.DataFrame(spreadsheet.worksheet("Comisiones").get_all_records())
-            # Guardar el cliente para escrituras
-            st.session_state['client'] = client
-            st.session_state['spreadsheet_name'] = "Dias_Economicos_Formacion_Continua"
-            
-        except Exception as e:
-            st.error(f"Error al cargar datos: {str(e)}")
-            st.stop()
-    else:
-        st.error("No se pudo conectar a Google Sheets")
-        st.stop()
+# Cargar datos desde la caché compartida (una descarga por hoja para todas las sesiones)
+almacen = obtener_almacen()
+pool = obtener_pool()
+# Una lectura pequeña dice qué hojas escribieron otras sesiones; solo esas se vuelven a descargar
+revisar_cambios()
+try:
+    # Las hojas vencidas se descargan en paralelo en una sola pasada
+    datos = almacen.obtener_varias(HOJAS_DATOS, cargar_hojas)
+    # Vistas sin copiar datos: con Copy-on-Write, si alguien modifica una columna
+    # se duplica solo esa columna y la instantánea compartida queda intacta
+    df_empleados = datos['Empleados'].copy(deep=False)
+    df_solicitudes = datos['Solicitudes'].copy(deep=False)
+    df_incapacidades = datos['Incapacidades'].copy(deep=False)
+    df_pendientes = datos['Pendientes_Empleado'].copy(deep=False)
+    df_constancias = datos['Constancias'].copy(deep=False)
+    df_comisiones = datos['Comisiones'].copy(deep=False)
+    # Sin conexión o con datos de disco aún sin revalidar no se escribe (los IDs y filas podrían estar desfasados)
+    SOLO_LECTURA = almacen.solo_lectura()
+    # La cola solo hace falta para escribir; con SQLite, crearla puede importar hojas de Sheets
+    cola = None if SOLO_LECTURA else obtener_cola()
+except ConnectionError:
+    st.error("No se pudo conectar a Google Sheets")
+    st.stop()
+except Exception as e:
+    st.error(f"Error al cargar datos: {str(e)}")
+    st.stop()
 
-# Usar los DataFrames desde session_state
-df_empleados = st.session_state['df_empleados'].copy()
-df_solicitudes = st.session_state['df_solicitudes'].copy()
-df_incapacidades = st.session_state['df_incapacidades'].copy()
-df_pendientes = st.session_state['df_pendientes'].copy()
-df_constancias = st.session_state['df_constancias'].copy()
-df_comisiones = st.session_state['df_comisiones'].copy()
+if almacen.error_conexion:
+    fechas = almacen.hojas_desde_disco()
+    origen = f"la instantánea guardada el {min(fechas.values())}" if fechas else "la última descarga"
+    st.error(f"📴 **Modo solo lectura:** no se pudo conectar a Google Sheets. Se muestran los datos de {origen}; "
+             "los registros y ediciones están deshabilitados hasta que vuelva la conexión.")
+elif SOLO_LECTURA:
+    st.info("⏳ Se muestran los datos guardados en disco mientras se revalidan con Google Sheets. "
+            "Los registros y ediciones se habilitan en cuanto termine.")
 
-# Calcular días disponibles
-for idx, emp in df_empleados.iterrows():
-    emp_id = emp['ID']
-    solicitudes_emp = df_solicitudes[df_solicitudes['EmpleadoID'] == emp_id]
-    
-    dias_usados = 0
-    for _, sol in solicitudes_emp.iterrows():
-        if sol['Tipo Permiso'] == 'economico':
-            dias_usados += int(sol['Dias Solicitados'])
-    
-    df_empleados.at[idx, 'DIAS_REALES'] = 9 - dias_usados
+# Calcular días disponibles (una vez por versión de los datos, compartido entre sesiones)
+saldos = almacen.derivado(
+    ('saldos', DIAS_ECONOMICOS_ANUALES), datos, ['Empleados', 'Solicitudes'],
+    lambda: calcular_saldos(datos['Empleados'], datos['Solicitudes']), contexto=datetime.now().year
+)
+df_empleados['DIAS_REALES'] = saldos['DIAS_REALES'].to_numpy()
+
+# Empleados por ID con las etiquetas de los selectores (depende también de los saldos)
+directorio = almacen.derivado(
+    ('directorio', DIAS_ECONOMICOS_ANUALES), datos, ['Empleados', 'Solicitudes'],
+    lambda: DirectorioEmpleados(df_empleados), contexto=datetime.now().year
+)
+
+# Historial de licencias por empleado y tipo para las validaciones
+indice_licencias = almacen.derivado(
+    ('licencias',), datos, ['Solicitudes'], lambda: IndiceLicencias(datos['Solicitudes'])
+)
+
+# Ausencias por día; se actualiza sola cuando se registra una solicitud o incapacidad
+ocupacion = almacen.derivado(
+    ('ocupacion',), datos, ['Solicitudes', 'Incapacidades'],
+    lambda: OcupacionDiaria(datos['Solicitudes'], datos['Incapacidades']),
+    al_agregar=OcupacionDiaria.agregar_registro
+)
+
+# Incapacidades acumuladas en el año por empleado (Artículo 44)
+acumulado_incap = almacen.derivado(
+    ('art44', 'anual'), datos, ['Incapacidades'],
+    lambda: acumular_incapacidades(datos['Incapacidades']), contexto=datetime.now().date()
+)
+
+# Días de cada solicitud/incapacidad repartidos por mes calendario (reportes mensuales)
+df_dias_mes = almacen.derivado(
+    ('dias_por_mes',), datos, ['Solicitudes', 'Incapacidades'],
+    lambda: dias_por_mes(datos['Solicitudes'], datos['Incapacidades'])
+)
+
+# Pendientes activos agrupados por empleado (detalle de Estatus Individual)
+pendientes_activos = almacen.derivado(
+    ('pendientes_activos',), datos, ['Pendientes_Empleado'],
+    lambda: pendientes_por_empleado(datos['Pendientes_Empleado'])
+)
+SIN_PENDIENTES = df_pendientes.iloc[0:0]
+
+# Conteo y texto de pendientes por empleado (columna PENDIENTES y avisos de Estatus Individual)
+df_resumen_pendientes = almacen.derivado(
+    ('resumen_pendientes',), datos, ['Pendientes_Empleado'],
+    lambda: resumen_pendientes(datos['Pendientes_Empleado'])
+)
+
+# Buscador de empleados sin acentos (Ver Empleados y Estatus Individual)
+indice_busqueda = almacen.derivado(
+    ('busqueda',), datos, ['Empleados'], lambda: IndiceBusqueda(datos['Empleados'])
+)
+
+# Búsqueda de traslapes entre ausencias (aviso en vivo de la pestaña de incapacidades)
+indice_intervalos = almacen.derivado(
+    ('intervalos',), datos, ['Solicitudes', 'Incapacidades'],
+    lambda: IndiceIntervalos(datos['Solicitudes'], datos['Incapacidades'])
+)
 
 # SIDEBAR: Alertas
 with st.sidebar:
@@ -1066,6 +720,18 @@ with st.sidebar:
     else:
         st.success("✅ Sin propuestas urgentes")
     
+    # Alertas del Artículo 44
+    st.markdown("---")
+    st.markdown("**🏥 Artículo 44**")
+    excedidos = int(acumulado_incap['EXCEDE'].sum())
+    en_precaucion = int((acumulado_incap['TOTAL'] > UMBRAL_PRECAUCION_ART44).sum()) - excedidos
+    if excedidos:
+        st.error(f"🚨 {excedidos} empleado(s) exceden {LIMITE_ART44} días de incapacidad en {datetime.now().year}")
+    if en_precaucion:
+        st.warning(f"⚠️ {en_precaucion} empleado(s) con más de {UMBRAL_PRECAUCION_ART44} días de incapacidad")
+    if not excedidos and not en_precaucion:
+        st.success("✅ Nadie cerca del límite")
+    
     st.markdown("---")
     st.markdown("**📊 Resumen General**")
     if len(df_empleados) > 0:
@@ -1073,21 +739,53 @@ with st.sidebar:
         st.metric("Solicitudes Registradas", len(df_solicitudes))
         dias_promedio = df_empleados['DIAS_REALES'].mean()
         st.metric("Días Disponibles (Promedio)", int(dias_promedio))
+    
+    with st.expander("📶 Cuota de Google Sheets"):
+        planificador = pool.planificador
+        for tipo, (usadas, limite) in planificador.uso_actual().items():
+            st.progress(min(usadas / limite, 1.0), text=f"{tipo.capitalize()}s último minuto: {usadas}/{limite}")
+        contadores = planificador.contadores
+        st.caption(f"Lecturas: {contadores['lecturas']} (combinadas: {contadores['lecturas_combinadas']}) · "
+                   f"Escrituras: {contadores['escrituras']}")
+        st.caption(f"Pico por minuto: {contadores['pico_lecturas']} lecturas / {contadores['pico_escrituras']} escrituras")
+        st.caption(f"Reintentos: {contadores['reintentos']} · Esperas por cuota: {contadores['esperas_por_cuota']} · "
+                   f"Errores: {contadores['errores']}")
+        if not SOLO_LECTURA:
+            detector = obtener_detector()
+            st.caption(f"Revisiones de cambios: {detector.contadores['revisiones']} · "
+                       f"Hojas recargadas por cambios de otras sesiones: {detector.contadores['hojas_recargadas']}")
+    
+    if almacen.tiempos:
+        with st.expander("⏱️ Tiempos de carga"):
+            for nombre_hoja, segundos in almacen.tiempos.items():
+                st.caption(f"{nombre_hoja}: {segundos:.2f} s")
+            if almacen.tiempo_ultima_carga is not None:
+                st.caption(f"**Última carga total:** {almacen.tiempo_ultima_carga:.2f} s")
+    
+    if almacen.memoria:
+        with st.expander("💾 Memoria por hoja"):
+            for nombre_hoja, (crudo, compacto) in almacen.memoria.items():
+                ahorro = (1 - compacto / crudo) * 100 if crudo else 0
+                st.caption(f"{nombre_hoja}: {crudo / 1024:.0f} KB → {compacto / 1024:.0f} KB ({ahorro:.0f}% menos)")
 
-# TABS PRINCIPALES
-tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
+# SECCIONES PRINCIPALES
+# A diferencia de st.tabs (que ejecuta las ocho pestañas en cada interacción),
+# solo se ejecuta el código de la sección seleccionada
+SECCIONES = [
     "📝 Días Económicos",
     "🏥 Incapacidades",
     "👥 Ver Empleados", 
     "📊 Estatus Individual",
     "📄 Reportes",
     "🔔 Recordatorios",
-    "📋 Gestión Documental",  # NUEVO
+    "📋 Gestión Documental",
     "📋 Normativa"
-])
+]
+seccion = st.radio("Sección", SECCIONES, horizontal=True, key="seccion_activa", label_visibility="collapsed")
+st.markdown("---")
 
 # TAB 1: DÍAS ECONÓMICOS
-with tab1:
+if seccion == SECCIONES[0]:
     st.header("Registrar Nueva Solicitud")
     
     if len(df_empleados) == 0:
@@ -1096,10 +794,8 @@ with tab1:
         col1, col2 = st.columns(2)
         
         with col1:
-            opciones = [(e['ID'], f"{e['PATERNO']} {e['MATERNO']} {e['NOMBRE']} - {e['PUESTO']} ({int(e['DIAS_REALES'])} días)") 
-                        for _, e in df_empleados.iterrows()]
-            emp_id = st.selectbox("Seleccionar Empleado", [o[0] for o in opciones], 
-                                  format_func=lambda x: next(o[1] for o in opciones if o[0]==x))
+            emp_id = st.selectbox("Seleccionar Empleado", directorio.ids, 
+                                  format_func=directorio.etiqueta_dias.get)
             
             tipo = st.selectbox("Tipo de Permiso", list(NORMATIVA.keys()), 
                                format_func=lambda x: f"{NORMATIVA[x]['nombre']} (max. {NORMATIVA[x]['max_dias']} días)")
@@ -1162,38 +858,25 @@ with tab1:
         motivo = st.text_area("Motivo/Descripción", height=100)
         
         # Info empleado
-        emp_info = df_empleados[df_empleados['ID']==emp_id].iloc[0]
+        emp_info = directorio.empleado(emp_id)
         st.info(f"""
         **📋 Información del Empleado:**
         - **RFC:** {emp_info['RFC']}
         - **Puesto:** {emp_info['PUESTO']}
         - **Centro de Trabajo:** {emp_info.get('CENTRO DE TRABAJO', 'N/A')}
-        - **Días Disponibles:** **{emp_info['DIAS_REALES']}/9**
+        - **Días Disponibles:** **{emp_info['DIAS_REALES']}/{DIAS_ECONOMICOS_ANUALES}**
         """)
         # Verificar si hay concentración de personal
         if fechas_procesadas and tipo == 'economico':
-            empleados_ausentes = []
-            
-            for fecha_check in fechas_procesadas:
-                # Contar cuántos empleados estarán ausentes ese día
-                for _, sol in df_solicitudes.iterrows():
-                    sol_inicio = pd.to_datetime(sol['Fecha Inicio'])
-                    sol_fin = pd.to_datetime(sol['Fecha Fin'])
-                    
-                    if sol_inicio.date() <= fecha_check.date() <= sol_fin.date():
-                        empleados_ausentes.append({
-                            'fecha': fecha_check.strftime('%d/%m/%Y'),
-                            'nombre': sol['Nombre Completo'],
-                            'tipo': sol['Tipo Permiso']
-                        })
-            
-            # Contar por fecha
-            from collections import Counter
-            fechas_count = Counter([e['fecha'] for e in empleados_ausentes])
-            
-            # Alertar si alguna fecha tiene 5+
-            for fecha, count in fechas_count.items():
+            for fecha_check in sorted(set(fechas_procesadas)):
+                # Cuántos empleados estarán ausentes ese día (lectura directa del índice)
+                count = ocupacion.ausentes(fecha_check)
+                if count == 0:
+                    continue
+                
+                # Alertar si alguna fecha tiene 5+
                 if count >= 4:  # 4 existentes + 1 nuevo = 5 total
+                    fecha = fecha_check.strftime('%d/%m/%Y')
                     st.error(f"""
                     🚨 **ALERTA: CONCENTRACIÓN DE PERSONAL**
                     
@@ -1205,16 +888,16 @@ with tab1:
                     """)
                     
                     # Mostrar quiénes estarán ausentes
-                    ausentes_fecha = [e for e in empleados_ausentes if e['fecha'] == fecha]
-                    for aus in ausentes_fecha[:5]:
-                        st.warning(f"• {aus['nombre']} - {aus['tipo']}")
+                    ausentes_fecha = ocupacion.empleados(fecha_check)
+                    for nombre_aus, tipo_aus in ausentes_fecha[:5]:
+                        st.warning(f"• {nombre_aus} - {tipo_aus}")
                     
                     if len(ausentes_fecha) > 5:
                         st.warning(f"... y {len(ausentes_fecha) - 5} más")
                 
                 st.markdown("---")
         
-        if st.button("✅ REGISTRAR SOLICITUD", type="primary", use_container_width=True):
+        if st.button("✅ REGISTRAR SOLICITUD", type="primary", use_container_width=True, disabled=SOLO_LECTURA):
             if not fechas_procesadas:
                 st.error("❌ Debes ingresar al menos una fecha válida")
             elif len(fechas_procesadas) != dias:
@@ -1223,7 +906,9 @@ with tab1:
                 fecha_inicio = fechas_procesadas[0]
                 fecha_fin = fechas_procesadas[-1]
                 
-                errores, advertencias = validar_solicitud(emp_id, tipo, dias, fecha_inicio, df_empleados, df_solicitudes)
+                errores, advertencias = validar_solicitud(
+                    emp_id, tipo, dias, fecha_inicio, df_empleados, df_solicitudes, indice_licencias, directorio
+                )
                 
                 if errores:
                     st.error("**❌ SOLICITUD RECHAZADA**")
@@ -1248,18 +933,10 @@ with tab1:
                         st.session_state['nombre_usuario']
                     ]
                     
-                    # RECONECTAR para escribir
-                    client = st.session_state['client']
-                    spreadsheet = client.open(st.session_state['spreadsheet_name'])
-                    sheet_sol = spreadsheet.worksheet("Solicitudes")
-                    sheet_emp = spreadsheet.worksheet("Empleados")
-
-                    # ESCRIBIR
-                    sheet_sol.append_row(nueva_fila)
-
-                    # Actualizar session_state
-                    st.session_state['df_solicitudes'] = pd.DataFrame(sheet_sol.get_all_records())
-                    st.session_state['df_empleados'] = pd.DataFrame(sheet_emp.get_all_records())
+                    # ESCRIBIR (la cola la envía en bloque y la añade a la caché compartida)
+                    escritura = cola.agregar_fila("Solicitudes", nueva_fila)
+                    cola.vaciar("Solicitudes")
+                    escritura.result()
                     dias_restantes = int(emp_info['DIAS_REALES'] - dias) if tipo == 'economico' else int(emp_info['DIAS_REALES'])
                     
                     # CONFIRMACIÓN
@@ -1268,7 +945,7 @@ with tab1:
                     st.success(f"### 📋 Folio: {nuevo_id}")
                     st.success(f"### 👤 {nombre}")
                     st.success(f"### 📅 Fechas: {fechas_str}")
-                    st.success(f"### 📊 Días restantes: **{dias_restantes}/9**")
+                    st.success(f"### 📊 Días restantes: **{dias_restantes}/{DIAS_ECONOMICOS_ANUALES}**")
                     st.success(f"### ✍️ Registrado por: {st.session_state['nombre_usuario']}")
                     st.toast(f"✅ Solicitud #{nuevo_id} registrada", icon="✅")
                     
@@ -1276,7 +953,7 @@ with tab1:
                         st.rerun()
 
 # TAB 2: INCAPACIDADES
-with tab2:
+if seccion == SECCIONES[1]:
     st.header("🏥 Registro de Incapacidades")
     
     if len(df_empleados) == 0:
@@ -1285,10 +962,8 @@ with tab2:
         col1, col2 = st.columns(2)
         
         with col1:
-            opciones_inc = [(e['ID'], f"{e['PATERNO']} {e['MATERNO']} {e['NOMBRE']} - {e['RFC']}") 
-                           for _, e in df_empleados.iterrows()]
-            emp_id_inc = st.selectbox("Seleccionar Empleado", [o[0] for o in opciones_inc], 
-                                      format_func=lambda x: next(o[1] for o in opciones_inc if o[0]==x), key="emp_incap")
+            emp_id_inc = st.selectbox("Seleccionar Empleado", directorio.ids, 
+                                      format_func=directorio.etiqueta_rfc.get, key="emp_incap")
             
             num_incapacidad = st.text_input("Número de Incapacidad (Folio IMSS)", placeholder="123456789")
             
@@ -1310,19 +985,13 @@ with tab2:
             telefono_emp = st.text_input("Teléfono Contacto", placeholder="3312345678")
         
         # Info empleado
-        emp_info_inc = df_empleados[df_empleados['ID']==emp_id_inc].iloc[0]
-        
-        # Calcular días acumulados en el año
-        incap_empleado = df_incapacidades[df_incapacidades['EmpleadoID'] == emp_id_inc]
-        if len(incap_empleado) > 0:
-            incap_empleado['Fecha_Inicio'] = pd.to_datetime(incap_empleado['Fecha Inicio'], errors='coerce')
-            incap_año = incap_empleado[incap_empleado['Fecha_Inicio'].dt.year == datetime.now().year]
-            dias_acumulados = int(incap_año['Dias Totales'].sum())
-        else:
-            dias_acumulados = 0
+        emp_info_inc = directorio.empleado(emp_id_inc)
+        
+        # Días acumulados en el año (precalculados para todos los empleados)
+        dias_acumulados = int(acumulado_incap['TOTAL'].get(emp_id_inc, 0))
         
         dias_con_nueva = dias_acumulados + dias_totales
-        excede = dias_con_nueva > 28  # Límite común Art. 44
+        excede = dias_con_nueva > LIMITE_ART44  # Límite común Art. 44
         
         if excede:
             st.error(f"""
@@ -1331,15 +1000,15 @@ with tab2:
             Este empleado acumularía **{dias_con_nueva} días** de incapacidad en {datetime.now().year}
             (Actual: {dias_acumulados} + Nueva: {dias_totales})
             
-            **EXCEDE EL LÍMITE DE 28 DÍAS**
+            **EXCEDE EL LÍMITE DE {LIMITE_ART44} DÍAS**
             
             Acciones requeridas:
             - ✓ Anexar Acta Circunstanciada
             - ✓ Anexar Oficio
             - ✓ Aplicar Artículo 44
             """)
-        elif dias_con_nueva > 20:
-            st.warning(f"⚠️ Precaución: Acumularía {dias_con_nueva} días de incapacidad en el año (límite: 28)")
+        elif dias_con_nueva > UMBRAL_PRECAUCION_ART44:
+            st.warning(f"⚠️ Precaución: Acumularía {dias_con_nueva} días de incapacidad en el año (límite: {LIMITE_ART44})")
         
         st.info(f"""
         **📋 Información del Empleado:**
@@ -1348,58 +1017,29 @@ with tab2:
         - **Días acumulados en {datetime.now().year}:** {dias_acumulados}
         """)
         
-        st.markdown("---")
+        # Verificar concentración de ausencias en esas fechas (en vivo al elegir las fechas)
+        ausentes = indice_intervalos.traslapes(fecha_inicio_inc, fecha_termino_inc)
         
-        # Verificar concentración de ausencias
-        if st.button("✅ REGISTRAR INCAPACIDAD", type="primary", use_container_width=True, key="btn_incap"):
+        # Alerta si hay 5 o más ausentes
+        if len(ausentes) >= 5:
+            st.warning(f"""
+            ⚠️ **ALERTA DE CONCENTRACIÓN DE PERSONAL**
             
-            # Verificar concentración de ausencias en esas fechas
-            ausentes = []
+            Del {fecha_inicio_inc.strftime('%d/%m/%Y')} al {fecha_termino_inc.strftime('%d/%m/%Y')}:
             
-            # Revisar solicitudes
-            for _, sol in df_solicitudes.iterrows():
-                sol_inicio = pd.to_datetime(sol['Fecha Inicio'])
-                sol_fin = pd.to_datetime(sol['Fecha Fin'])
-                
-                if (fecha_inicio_inc <= sol_fin.date() and fecha_termino_inc >= sol_inicio.date()):
-                    ausentes.append({
-                        'nombre': sol['Nombre Completo'],
-                        'tipo': sol['Tipo Permiso'],
-                        'inicio': sol_inicio.strftime('%d/%m/%Y'),
-                        'fin': sol_fin.strftime('%d/%m/%Y')
-                    })
+            **{len(ausentes)} empleados ausentes simultáneamente:**
+            """)
+            for aus in ausentes[:10]:  # Mostrar máximo 10
+                st.warning(f"• {aus['nombre']} - {aus['tipo']} ({aus['inicio']} - {aus['fin']})")
             
-            # Revisar incapacidades
-            for _, inc in df_incapacidades.iterrows():
-                inc_inicio = pd.to_datetime(inc['Fecha Inicio'], errors='coerce')
-                inc_fin = pd.to_datetime(inc['Fecha Termino'], errors='coerce')
-                
-                if pd.notna(inc_inicio) and pd.notna(inc_fin):
-                    if (fecha_inicio_inc <= inc_fin.date() and fecha_termino_inc >= inc_inicio.date()):
-                        ausentes.append({
-                            'nombre': inc['Nombre Completo'],
-                            'tipo': 'Incapacidad',
-                            'inicio': inc_inicio.strftime('%d/%m/%Y'),
-                            'fin': inc_fin.strftime('%d/%m/%Y')
-                        })
-            
-            # Alerta si hay 5 o más ausentes
-            if len(ausentes) >= 5:
-                st.warning(f"""
-                ⚠️ **ALERTA DE CONCENTRACIÓN DE PERSONAL**
-                
-                Del {fecha_inicio_inc.strftime('%d/%m/%Y')} al {fecha_termino_inc.strftime('%d/%m/%Y')}:
-                
-                **{len(ausentes)} empleados ausentes simultáneamente:**
-                """)
-                for aus in ausentes[:10]:  # Mostrar máximo 10
-                    st.warning(f"• {aus['nombre']} - {aus['tipo']} ({aus['inicio']} - {aus['fin']})")
-                
-                if len(ausentes) > 10:
-                    st.warning(f"... y {len(ausentes) - 10} más")
-                
-                st.warning("⚠️ **IMPACTO OPERATIVO:** Posible desabasto de personal")
+            if len(ausentes) > 10:
+                st.warning(f"... y {len(ausentes) - 10} más")
             
+            st.warning("⚠️ **IMPACTO OPERATIVO:** Posible desabasto de personal")
+        
+        st.markdown("---")
+        
+        if st.button("✅ REGISTRAR INCAPACIDAD", type="primary", use_container_width=True, key="btn_incap", disabled=SOLO_LECTURA):
             # Registrar incapacidad
             nombre = f"{emp_info_inc['PATERNO']} {emp_info_inc['MATERNO']} {emp_info_inc['NOMBRE']}"
             mes_corresp = fecha_inicio_inc.strftime('%B %Y')
@@ -1430,16 +1070,10 @@ with tab2:
                 st.session_state['nombre_usuario']
             ]
             
-            # RECONECTAR para escribir
-            client = st.session_state['client']
-            spreadsheet = client.open(st.session_state['spreadsheet_name'])
-            sheet_incap = spreadsheet.worksheet("Incapacidades")
-
-            # ESCRIBIR
-            sheet_incap.append_row(nueva_incap)
-
-            # Actualizar session_state
-            st.session_state['df_incapacidades'] = pd.DataFrame(sheet_incap.get_all_records())
+            # ESCRIBIR (la cola la envía en bloque y la añade a la caché compartida)
+            escritura = cola.agregar_fila("Incapacidades", nueva_incap)
+            cola.vaciar("Incapacidades")
+            escritura.result()
                         
             st.success("# ✅ ¡INCAPACIDAD REGISTRADA!")
             st.balloons()
@@ -1466,7 +1100,7 @@ with tab2:
         st.info("No hay incapacidades registradas")
 
 # TAB 3: VER EMPLEADOS
-with tab3:
+if seccion == SECCIONES[2]:
     st.header("👥 Plantilla de Personal")
     
     if len(df_empleados) > 0:
@@ -1475,69 +1109,27 @@ with tab3:
             busqueda = st.text_input("🔍 Buscar por nombre, RFC o puesto")
         with col2:
             with col2:
-                if st.button("🔄 Actualizar Datos"):
-                    # Calcular días USADOS (aprobados)
-                    df_solicitudes_aprobadas = df_solicitudes[df_solicitudes['Aprobado Por'].notna() & (df_solicitudes['Aprobado Por'] != '')]
-                    dias_usados = df_solicitudes_aprobadas.groupby('RFC')['Dias Solicitados'].sum().to_dict()
-                    
-                    # Actualizar
-                    client = st.session_state['client']
-                    spreadsheet = client.open(st.session_state['spreadsheet_name'])
-                    sheet_empleados = spreadsheet.worksheet("Empleados")
-                    
-                    todos_rfcs = sheet_empleados.col_values(2)[1:]  # Columna B = RFC
-                    dias_totales = sheet_empleados.col_values(14)[1:]  # Columna N = DIAS TOTALES
-                    
-                    # DISPONIBLES = TOTALES - USADOS
-                    valores_actualizar = []
-                    for rfc, total in zip(todos_rfcs, dias_totales):
-                        usados = dias_usados.get(rfc, 0)
-                        try:
-                            disponibles = int(float(total)) - usados
-                        except:
-                            disponibles = int(float(total)) if total else 0
-                        valores_actualizar.append([disponibles])
-                    
-                    # Escribir en columna M (13)
-                    rango = f'M2:M{len(valores_actualizar) + 1}'
-                    sheet_empleados.update(rango, valores_actualizar)
-                    
-                    st.success("✅ Días disponibles actualizados")
-                    st.rerun()
+                if st.button("🔄 Actualizar Datos", disabled=SOLO_LECTURA):
+                    # Solo se escriben las celdas de la columna M cuyo valor cambió
+                    ediciones = conciliar_dias_disponibles(datos['Empleados'], datos['Solicitudes'])
+                    if ediciones:
+                        # Un solo batch_update con las celdas agrupadas en rangos (también actualiza la caché)
+                        escritura = cola.editar_celdas("Empleados", ediciones)
+                        cola.vaciar("Empleados")
+                        escritura.result()
+                        st.success(f"✅ Días disponibles actualizados: {len(ediciones)} celda(s) modificada(s)")
+                    else:
+                        st.info("✅ Los días disponibles ya estaban al día, no se escribió nada")
         
-        df_filtrado = df_empleados.copy()
+        df_filtrado = df_empleados
         if busqueda:
-            mascara = (
-                df_filtrado['PATERNO'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['MATERNO'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['NOMBRE'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['RFC'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['PUESTO'].str.contains(busqueda, case=False, na=False)
-            )
-            df_filtrado = df_filtrado[mascara]
+            df_filtrado = df_filtrado.iloc[indice_busqueda.buscar(busqueda)]
         
         st.info(f"📊 Mostrando {len(df_filtrado)} de {len(df_empleados)} empleados")
         
-        # Agregar columna de pendientes
+        # Agregar columna de pendientes (resumen ya calculado por empleado)
         df_mostrar = df_filtrado.copy()
-        pendientes_count = []
-        for _, emp in df_mostrar.iterrows():
-            pends = df_pendientes[
-                (df_pendientes['EmpleadoID'] == emp['ID']) & 
-                (df_pendientes['Estado'] == 'Pendiente')
-            ]
-            count = len(pends)
-            
-            if count > 0:
-                descripciones = pends['Tipo_Pendiente'].head(2).tolist()
-                texto = f"⚠️ {count}: {', '.join(descripciones)}"
-                if count > 2:
-                    texto += "..."
-                pendientes_count.append(texto)
-            else:
-                pendientes_count.append('✅ 0')
-        
-        df_mostrar['PENDIENTES'] = pendientes_count
+        df_mostrar['PENDIENTES'] = df_mostrar['ID'].map(df_resumen_pendientes['PENDIENTES']).fillna('✅ 0')
         
         columnas_mostrar = ['RFC', 'PATERNO', 'MATERNO', 'NOMBRE', 'PUESTO', 'DIAS_REALES', 'PENDIENTES']
         df_display = df_mostrar[columnas_mostrar].copy()
@@ -1548,7 +1140,7 @@ with tab3:
         st.warning("No hay empleados registrados")
 
 # TAB 4: ESTATUS INDIVIDUAL
-with tab4:
+if seccion == SECCIONES[3]:
     st.header("📊 Estatus Individual de Empleados")
     
     if len(df_empleados) > 0:
@@ -1556,36 +1148,50 @@ with tab4:
         
         df_filtrado = df_empleados
         if busqueda:
-            mascara = (
-                df_filtrado['PATERNO'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['MATERNO'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['NOMBRE'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['RFC'].str.contains(busqueda, case=False, na=False)
-            )
-            df_filtrado = df_filtrado[mascara]
+            df_filtrado = df_filtrado.iloc[indice_busqueda.buscar(busqueda)]
         
-        for _, emp in df_filtrado.iterrows():
+        # Paginación: la página vuelve a la 1 cuando cambia la búsqueda
+        paginas = max(1, -(-len(df_filtrado) // EMPLEADOS_POR_PAGINA))
+        col_info, col_pagina = st.columns([3, 1])
+        with col_pagina:
+            pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1,
+                                     key=f"pagina_individual_{busqueda}_{paginas}")
+        with col_info:
+            st.info(f"📊 {len(df_filtrado)} empleados - página {pagina} de {paginas}")
+        
+        inicio_pagina = (pagina - 1) * EMPLEADOS_POR_PAGINA
+        abierto = st.session_state.get('empleado_abierto')
+        
+        for _, emp in df_filtrado.iloc[inicio_pagina:inicio_pagina + EMPLEADOS_POR_PAGINA].iterrows():
             nombre = f"{emp['PATERNO']} {emp['MATERNO']} {emp['NOMBRE']}"
             
-            # Contar pendientes
-            pendientes_emp = df_pendientes[
-                (df_pendientes['EmpleadoID'] == emp['ID']) & 
-                (df_pendientes['Estado'] == 'Pendiente')
-            ]
-            num_pendientes = len(pendientes_emp)
+            # Contar pendientes (resumen ya calculado por empleado)
+            num_pendientes = int(df_resumen_pendientes['NUM_PENDIENTES'].get(emp['ID'], 0))
             
             titulo = f"👤 {nombre} - {emp['PUESTO']}"
             if num_pendientes > 0:
                 titulo += f" ⚠️ {num_pendientes} pendiente(s)"
             
-            with st.expander(titulo):
+            col_titulo, col_boton = st.columns([5, 1])
+            with col_titulo:
+                st.markdown(f"**{titulo}**")
+            with col_boton:
+                st.button("Cerrar" if emp['ID'] == abierto else "Ver detalle", key=f"ver_{emp['ID']}",
+                          on_click=alternar_empleado_abierto, args=(emp['ID'],))
+            
+            # Solo el empleado abierto consulta pendientes, historial y formulario
+            if emp['ID'] != abierto:
+                continue
+            
+            pendientes_emp = pendientes_activos.get(emp['ID'], SIN_PENDIENTES)
+            with st.container():
                 col1, col2, col3, col4 = st.columns(4)
                 
                 dias_disp = int(emp['DIAS_REALES'])
                 color = "🟢" if dias_disp > 3 else "🟡" if dias_disp > 1 else "🔴"
                 
                 with col1:
-                    st.metric("Días Disponibles", f"{color} {dias_disp}/9")
+                    st.metric("Días Disponibles", f"{color} {dias_disp}/{DIAS_ECONOMICOS_ANUALES}")
                 with col2:
                     solicitudes_emp = df_solicitudes[df_solicitudes['EmpleadoID'] == emp['ID']]
                     st.metric("Total Solicitudes", len(solicitudes_emp))
@@ -1612,34 +1218,29 @@ with tab4:
                         with col_p1:
                             st.error(f"""
                             **{pend['Tipo_Pendiente']}:** {pend['Descripcion']}  
-                            Registrado: {pend['Fecha_Registro']}
+                            Registrado: {pend['Fecha_Registro'].strftime('%d/%m/%Y') if pd.notna(pend['Fecha_Registro']) else 'N/A'}
                             """)
                         with col_p2:
-                            if st.button("✅ Completar", key=f"comp_{pend['ID']}"):
-                                # RECONECTAR para escribir
-                                client = st.session_state['client']
-                                spreadsheet = client.open(st.session_state['spreadsheet_name'])
-                                sheet_pend = spreadsheet.worksheet("Pendientes_Empleado")
-                                
-                                # Buscar en la COLUMNA A (ID) específicamente
-                                todos_ids = sheet_pend.col_values(1)  # Columna A = IDs
+                            if st.button("✅ Completar", key=f"comp_{pend['ID']}", disabled=SOLO_LECTURA):
+                                # Fila del pendiente según el mapa ID -> fila de la caché (sin leer la columna A)
+                                fila = almacen.fila_de("Pendientes_Empleado", pend['ID'])
                                 
-                                try:
-                                    fila = todos_ids.index(str(pend['ID'])) + 1  # +1 porque index empieza en 0
-                                    
+                                if fila is None:
+                                    st.error(f"❌ No se encontró el pendiente ID {pend['ID']}")
+                                else:
                                     # Actualizar las celdas
-                                    sheet_pend.update_cell(fila, 9, 'Completado')
-                                    sheet_pend.update_cell(fila, 11, datetime.now().strftime('%Y-%m-%d'))
-                                    sheet_pend.update_cell(fila, 12, st.session_state['nombre_usuario'])
-                                    
-                                    # Actualizar session_state
-                                    st.session_state['df_pendientes'] = pd.DataFrame(sheet_pend.get_all_records())
+                                    ediciones = [
+                                        (fila, 9, 'Completado'),
+                                        (fila, 11, datetime.now().strftime('%Y-%m-%d')),
+                                        (fila, 12, st.session_state['nombre_usuario'])
+                                    ]
+                                    # Un solo batch_update para las tres celdas (también actualiza la caché)
+                                    escritura = cola.editar_celdas("Pendientes_Empleado", ediciones)
+                                    cola.vaciar("Pendientes_Empleado")
+                                    escritura.result()
                                     
                                     st.success("✅ Marcado como completado")
                                     st.rerun()
-                                    
-                                except ValueError:
-                                    st.error(f"❌ No se encontró el pendiente ID {pend['ID']}")
                 else:
                     st.success("### ✅ SIN PENDIENTES - Todo al día")
                 
@@ -1670,7 +1271,7 @@ with tab4:
                                                    value=datetime.now().year,
                                                    key=f"año_pend_{emp['ID']}")
                     
-                    if st.button("Registrar Pendiente", key=f"reg_pend_{emp['ID']}"):
+                    if st.button("Registrar Pendiente", key=f"reg_pend_{emp['ID']}", disabled=SOLO_LECTURA):
                         if desc_pend:
                             nuevo_pend = [
                                 len(df_pendientes) + 1,
@@ -1686,16 +1287,10 @@ with tab4:
                                 '',
                                 ''
                             ]
-                            # RECONECTAR para escribir
-                            client = st.session_state['client']
-                            spreadsheet = client.open(st.session_state['spreadsheet_name'])
-                            sheet_pend = spreadsheet.worksheet("Pendientes_Empleado")
-
-                            # ESCRIBIR
-                            sheet_pend.append_row(nuevo_pend)
-
-                            # Actualizar session_state
-                            st.session_state['df_pendientes'] = pd.DataFrame(sheet_pend.get_all_records())
+                            # ESCRIBIR (la cola la envía en bloque y la añade a la caché compartida)
+                            escritura = cola.agregar_fila("Pendientes_Empleado", nuevo_pend)
+                            cola.vaciar("Pendientes_Empleado")
+                            escritura.result()
 
                             st.success("✅ Pendiente registrado")
                             st.rerun()
@@ -1710,9 +1305,10 @@ with tab4:
                     if 'Registrado Por' in solicitudes_emp.columns:
                         columnas.append('Registrado Por')
                     st.dataframe(solicitudes_emp[columnas], use_container_width=True, hide_index=True)
+                st.markdown("---")
 
 # TAB 5: REPORTES
-with tab5:
+if seccion == SECCIONES[4]:
     st.header("📄 Generación de Reportes")
     
     st.info("🎯 Reportes integrados con trazabilidad total y exportación completa del mes")
@@ -1734,7 +1330,7 @@ with tab5:
             with st.spinner("Generando reporte completo..."):
                 excel_completo = generar_reporte_completo_mes(
                     df_empleados, df_solicitudes, df_incapacidades, df_pendientes,
-                    mes_reporte, año_reporte
+                    mes_reporte, año_reporte, df_dias_mes
                 )
                 
                 mes_nombre = datetime(2000, mes_reporte, 1).strftime('%B')
@@ -1815,7 +1411,43 @@ with tab5:
     
     st.markdown("---")
     
-    # Sección 4: ESTADÍSTICAS GENERALES
+    # Sección 4: RIESGO ARTÍCULO 44
+    st.markdown("### 🏥 Riesgo Artículo 44")
+    st.markdown(f"Empleados con más de {UMBRAL_PRECAUCION_ART44} días de incapacidad (límite: {LIMITE_ART44})")
+    
+    ventana_art44 = st.radio(
+        "Periodo",
+        ["anual", "movil"],
+        format_func=lambda x: f"Año calendario {datetime.now().year}" if x == 'anual' else "Últimos 365 días",
+        horizontal=True,
+        key="ventana_art44"
+    )
+    acumulado_ventana = almacen.derivado(
+        ('art44', ventana_art44), datos, ['Incapacidades'],
+        lambda: acumular_incapacidades(datos['Incapacidades'], ventana=ventana_art44), contexto=datetime.now().date()
+    )
+    df_riesgo = reporte_riesgo_art44(acumulado_ventana, df_empleados)
+    
+    if len(df_riesgo) > 0:
+        st.dataframe(df_riesgo, use_container_width=True, hide_index=True)
+        
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df_riesgo.to_excel(writer, sheet_name='Riesgo Art 44', index=False)
+        
+        st.download_button(
+            "💾 Descargar Riesgo Art. 44",
+            output.getvalue(),
+            f"riesgo_art44_{datetime.now().strftime('%Y%m%d')}.xlsx",
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            use_container_width=True
+        )
+    else:
+        st.success("✅ Ningún empleado está cerca del límite")
+    
+    st.markdown("---")
+    
+    # Sección 5: ESTADÍSTICAS GENERALES
     st.markdown("### 📊 Estadísticas Generales")
     
     if len(df_empleados) > 0:
@@ -1830,12 +1462,11 @@ with tab5:
             st.metric("Total Días Disponibles", int(total_dias))
         with col4:
             if len(df_solicitudes) > 0:
-                df_solicitudes['Fecha_Reg'] = pd.to_datetime(df_solicitudes['Fecha Registro'], errors='coerce')
-                dias_usados = df_solicitudes[df_solicitudes['Fecha_Reg'].dt.year == datetime.now().year]['Dias Solicitados'].sum()
-                st.metric("Días Usados (2025)", int(dias_usados))
+                dias_usados = df_solicitudes[df_solicitudes['Fecha Registro'].dt.year == datetime.now().year]['Dias Solicitados'].sum()
+                st.metric(f"Días Usados ({datetime.now().year})", int(dias_usados))
 
 # TAB 6: RECORDATORIOS
-with tab6:
+if seccion == SECCIONES[5]:
     st.header("🔔 Recordatorios de Fechas Límite")
     
     st.info("📅 Fechas límite para entregar propuestas de pago a RH Central")
@@ -1883,7 +1514,7 @@ with tab6:
                 st.info(f"Límite: {item['fecha']}")
 
 # TAB 7: GESTIÓN DOCUMENTAL
-with tab7:
+if seccion == SECCIONES[6]:
     st.header("📋 Gestión Documental")
     
     tipo_doc = st.selectbox(
@@ -1896,9 +1527,6 @@ with tab7:
         st.markdown("---")
         st.subheader("Generador de Constancias de Servicio")
         
-        # Usar datos ya cargados desde session_state
-        df_constancias = st.session_state['df_constancias']
-        
         if len(df_constancias) == 0:
             st.error("❌ No hay datos de empleados en la hoja Constancias")
             st.stop()
@@ -1996,12 +1624,8 @@ with tab7:
         
         st.markdown("---")
         
-        # Cargar datos de comisiones desde Google Sheets
-        if 'df_comisiones' not in st.session_state:
-            st.error("❌ No hay hoja 'Comisiones' en Google Sheets")
-            st.stop()
-        
-        df_comisiones_todas = st.session_state['df_comisiones']
+        # Datos de comisiones ya cargados desde la caché compartida
+        df_comisiones_todas = df_comisiones
         
         # Filtrar por tipo
         if tipo_comision == "Encargados CM":
@@ -2118,9 +1742,8 @@ with tab7:
     else:
         st.info("🚧 Esta funcionalidad estará disponible próximamente")
 
-
 # TAB 8: NORMATIVA
-with tab8:
+if seccion == SECCIONES[7]:
     st.header("📋 Normativa Aplicable")
     
     st.info("""
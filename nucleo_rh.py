@@ -0,0 +1,1952 @@
+"""Lógica de RH sin interfaz: caché de hojas, acceso a Google Sheets, cálculos y reportes.
+
+La usan la app de Streamlit (app3.py) y el recálculo nocturno (recalculo_nocturno.py).
+"""
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta, timezone
+import gspread
+from google.oauth2.service_account import Credentials
+from google.auth.exceptions import GoogleAuthError, RefreshError
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Copy-on-Write: una copia superficial de una instantánea compartida solo duplica
+# una columna cuando alguien la modifica (en pandas 3 ya es el comportamiento normal)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+SPREADSHEET_NAME = "Dias_Economicos_Formacion_Continua"
+
+# Hojas que usa la app principal (en orden de carga)
+HOJAS_DATOS = ['Empleados', 'Solicitudes', 'Incapacidades', 'Pendientes_Empleado', 'Constancias', 'Comisiones']
+
+# Días económicos que corresponden a cada empleado por año
+DIAS_ECONOMICOS_ANUALES = 9
+
+# Artículo 44: límite de días de incapacidad al año y umbral para avisar con anticipación
+LIMITE_ART44 = 28
+UMBRAL_PRECAUCION_ART44 = 20
+TIPOS_INCAPACIDAD = ["Enfermedad General", "Maternidad", "Riesgo de Trabajo", "Posible Riesgo de Trabajo"]
+
+# Columnas por defecto cuando la hoja existe pero está vacía
+COLUMNAS_POR_DEFECTO = {
+    'Solicitudes': ['ID', 'EmpleadoID', 'RFC', 'Nombre Completo', 'Tipo Permiso', 'Fecha Inicio',
+                    'Fecha Fin', 'Dias Solicitados', 'Motivo', 'Fecha Registro', 'Aprobado Por',
+                    'Registrado Por'],
+    'Incapacidades': ['ID', 'EmpleadoID', 'RFC', 'Nombre Completo', 'Correo Empleado',
+                      'Telefono Contacto', 'Numero Incapacidad', 'Fecha Inicio',
+                      'Fecha Termino', 'Dias Totales', 'Tipo Incapacidad', 'Excede Dias',
+                      'Dias Enfermedad General', 'Dias Maternidad', 'Dias Riesgo Trabajo',
+                      'Dias Posible Riesgo', 'Mes Correspondiente', 'Estado', 'Registrado Por'],
+    'Pendientes_Empleado': ['ID', 'EmpleadoID', 'RFC', 'Nombre Completo', 'Tipo_Pendiente',
+                            'Descripcion', 'Quincena', 'Año', 'Estado', 'Fecha_Registro',
+                            'Fecha_Completado', 'Completado_Por'],
+}
+
+# Tipos de cada hoja: se aplican una sola vez al cargarla (y al escribir en ella).
+# 'repetidas' son textos que se repiten mucho; solo se vuelven categorías en modo compacto.
+ESQUEMAS = {
+    'Empleados': {'enteros': ['ID']},
+    'Solicitudes': {
+        'enteros': ['ID', 'EmpleadoID'],
+        'dias': ['Dias Solicitados'],
+        'fechas': ['Fecha Inicio', 'Fecha Fin', 'Fecha Registro'],
+        'categorias': ['Tipo Permiso'],
+        'repetidas': ['RFC', 'Nombre Completo', 'Aprobado Por', 'Registrado Por'],
+    },
+    'Incapacidades': {
+        'enteros': ['ID', 'EmpleadoID'],
+        'dias': ['Dias Totales', 'Dias Enfermedad General', 'Dias Maternidad',
+                 'Dias Riesgo Trabajo', 'Dias Posible Riesgo'],
+        'fechas': ['Fecha Inicio', 'Fecha Termino'],
+        'categorias': ['Tipo Incapacidad', 'Estado'],
+        'repetidas': ['RFC', 'Nombre Completo', 'Correo Empleado', 'Telefono Contacto',
+                      'Excede Dias', 'Mes Correspondiente', 'Registrado Por'],
+    },
+    'Pendientes_Empleado': {
+        'enteros': ['ID', 'EmpleadoID', 'Año'],
+        'fechas': ['Fecha_Registro', 'Fecha_Completado'],
+        'categorias': ['Tipo_Pendiente', 'Estado'],
+        'repetidas': ['RFC', 'Nombre Completo', 'Quincena', 'Completado_Por'],
+    },
+}
+
+# Columnas con índice en el almacenamiento SQLite (las que existan en cada tabla)
+COLUMNAS_INDEXADAS = ['EmpleadoID', 'Tipo Permiso', 'Fecha Inicio', 'Fecha Fin', 'Fecha Termino', 'Estado']
+
+TTL_CACHE_SEGUNDOS = 300
+
+# Carpeta de las instantáneas Parquet de cada hoja (arranque en frío y lectura sin conexión)
+CARPETA_INSTANTANEAS = '.instantaneas'
+
+# Cuota por minuto de la API de Sheets (por usuario de la cuenta de servicio)
+CUOTA_LECTURAS_POR_MINUTO = 60
+CUOTA_ESCRITURAS_POR_MINUTO = 60
+
+# Tiempo máximo que una escritura espera en la cola antes de enviarse
+INTERVALO_COLA_SEGUNDOS = 2
+
+# Prefijo de las hojas espejo que recibe Google Sheets cuando SQLite es el almacenamiento principal
+# (nunca se sobrescriben las hojas de datos, que pueden tener escrituras posteriores)
+PREFIJO_ESPEJO = 'Espejo_'
+
+# Hoja de control con una versión por hoja de datos; cada escritura cambia la de su hoja
+HOJA_VERSIONES = '_Versiones'
+# Cada cuánto (como mínimo) se consulta esa hoja para detectar escrituras de otras sesiones
+INTERVALO_REVISION_SEGUNDOS = 15
+
+# Columnas de Empleados que entran en los buscadores
+COLUMNAS_BUSQUEDA = ['PATERNO', 'MATERNO', 'NOMBRE', 'RFC', 'CURP', 'PUESTO', 'CENTRO DE TRABAJO']
+
+NORMATIVA = {
+    'economico': {
+        'nombre': 'Día Económico', 
+        'max_dias': 3, 
+        'max_ocasiones': 3, 
+        'intervalo_dias': 30, 
+        'descripcion': 'Hasta 3 ocasiones por año',
+        'limite': '3 ocasiones/año'
+    },
+    'matrimonio': {
+        'nombre': 'Matrimonio', 
+        'max_dias': 10, 
+        'max_ocasiones': 1, 
+        'descripcion': 'Por una sola ocasión en la vida',
+        'limite': '1 vez en la vida'
+    },
+    'fallecimiento': {
+        'nombre': 'Fallecimiento/Enfermedad Grave', 
+        'max_dias': 5, 
+        'descripcion': 'Parientes primer grado',
+        'limite': 'Sin límite'
+    },
+    'jubilacion': {
+        'nombre': 'Trámites Jubilación', 
+        'max_dias': 2, 
+        'descripcion': 'Solo cuando se jubila',
+        'limite': '1 vez en la vida'
+    },
+    'examen': {
+        'nombre': 'Examen Profesional/Tesis', 
+        'max_dias': 3, 
+        'descripcion': 'Presentación de grado',
+        'limite': 'Máximo 3 veces'
+    },
+    'mudanza': {
+        'nombre': 'Cambio de Domicilio', 
+        'max_dias': 1, 
+        'descripcion': 'Para mudanza',
+        'limite': '2 veces/año'
+    }
+}
+
+def conectar_con_credenciales(info):
+    """Cliente de gspread a partir de los datos de la cuenta de servicio; None si falla"""
+    try:
+        creds = Credentials.from_service_account_info(info, scopes=SCOPES)
+        return gspread.authorize(creds)
+    except:
+        return None
+
+# ============= CACHÉ COMPARTIDA =============
+class Instantanea(dict):
+    """{nombre: DataFrame} de una lectura del almacén; `versiones` guarda la versión de cada hoja leída"""
+
+    def __init__(self, hojas, versiones):
+        super().__init__(hojas)
+        self.versiones = versiones
+
+class AlmacenDatos:
+    """Instantáneas de solo lectura de cada hoja, compartidas por todas las sesiones del proceso.
+
+    Cada hoja se descarga una sola vez y se reutiliza hasta que vence el TTL o
+    hasta que una escritura la invalida. Los DataFrames entregados son compartidos:
+    quien necesite modificarlos debe trabajar sobre una copia.
+    """
+
+    def __init__(self, ttl_segundos=TTL_CACHE_SEGUNDOS, normalizar=None, instantaneas=None):
+        self.ttl_segundos = ttl_segundos
+        self.normalizar = normalizar or (lambda nombre, df: df)
+        self.instantaneas = instantaneas
+        self.version = 0
+        self.tiempos = {}
+        self.memoria = {}
+        self.tiempo_ultima_carga = None
+        self.error_conexion = None
+        self._hojas = {}
+        self._derivados = {}
+        self._cargadas_alguna_vez = set()
+        self._lock = threading.RLock()
+
+    def vigente(self, nombre):
+        entrada = self._hojas.get(nombre)
+        return entrada is not None and time.monotonic() - entrada['cargado'] < self.ttl_segundos
+
+    def _guardar_entrada(self, nombre, df, segundos, huella, desde_disco=None):
+        """Tipa y publica una hoja descargada (o leída de disco, con la fecha de su instantánea)"""
+        self.version += 1
+        tipado = self.normalizar(nombre, df)
+        self._hojas[nombre] = {'df': tipado, 'cargado': time.monotonic(), 'version': self.version,
+                               'huella': huella, 'desde_disco': desde_disco}
+        self.tiempos[nombre] = segundos
+        self.memoria[nombre] = (memoria_df(df), memoria_df(tipado))
+        self._cargadas_alguna_vez.add(nombre)
+
+    def _descargar(self, nombres, cargador):
+        """Pide las hojas al cargador, las publica y actualiza sus instantáneas en disco"""
+        descargadas = {nombre: (df, segundos, huella_df(df)) for nombre, (df, segundos) in cargador(nombres).items()}
+        with self._lock:
+            self.error_conexion = None
+            for nombre, (df, segundos, huella) in descargadas.items():
+                entrada = self._hojas.get(nombre)
+                if entrada is not None and entrada['huella'] == huella:
+                    # Sin cambios: se conserva la versión para no recalcular los derivados
+                    entrada.update({'cargado': time.monotonic(), 'desde_disco': None})
+                    self.tiempos[nombre] = segundos
+                else:
+                    self._guardar_entrada(nombre, df, segundos, huella)
+        if self.instantaneas is not None:
+            for nombre, (df, _, huella) in descargadas.items():
+                self.instantaneas.guardar(nombre, df, huella)
+
+    def obtener_varias(self, nombres, cargador):
+        """Devuelve una Instantanea {nombre: DataFrame}; las hojas vencidas se piden juntas a `cargador(vencidas)`.
+
+        El cargador recibe la lista de hojas a descargar y devuelve
+        {nombre: (DataFrame, segundos)}, lo que permite traerlas en paralelo.
+
+        Con `instantaneas`, una hoja que aún no está en memoria (arranque en frío)
+        se sirve de inmediato desde su instantánea en disco y se revalida contra
+        el cargador en segundo plano. Si el cargador falla, las hojas vencidas se
+        siguen sirviendo desde memoria o desde disco y `error_conexion` guarda el
+        error; mientras haya hojas sin confirmar, `solo_lectura()` es True.
+
+        Las versiones de la Instantanea son las de esos mismos DataFrames, aunque
+        otra sesión recargue la hoja después: con ellas se piden los derivados.
+        """
+        with self._lock:
+            vencidas = [nombre for nombre in nombres if not self.vigente(nombre)]
+            if vencidas:
+                inicio = time.perf_counter()
+                # Solo en el arranque en frío: una hoja invalidada tras escribir se vuelve a descargar
+                nuevas = [nombre for nombre in vencidas if nombre not in self._cargadas_alguna_vez]
+                desde_disco = self._cargar_instantaneas(nuevas)
+                por_descargar = [nombre for nombre in vencidas if nombre not in desde_disco]
+                if por_descargar:
+                    try:
+                        self._descargar(por_descargar, cargador)
+                    except Exception as e:
+                        self._cargar_instantaneas([nombre for nombre in por_descargar if nombre not in self._hojas])
+                        if any(nombre not in self._hojas for nombre in por_descargar):
+                            raise
+                        self.error_conexion = str(e) or type(e).__name__
+                        for nombre in por_descargar:
+                            # Se vuelve a intentar cuando venza el TTL, no en cada interacción
+                            self._hojas[nombre]['cargado'] = time.monotonic()
+                if desde_disco:
+                    self._revalidar_en_segundo_plano(list(desde_disco), cargador)
+                self.tiempo_ultima_carga = time.perf_counter() - inicio
+            return self._instantanea(nombres)
+
+    def _instantanea(self, nombres):
+        return Instantanea({nombre: self._hojas[nombre]['df'] for nombre in nombres},
+                           {nombre: self._hojas[nombre]['version'] for nombre in nombres})
+
+    def _cargar_instantaneas(self, nombres):
+        """Publica las instantáneas en disco de `nombres`; devuelve las que encontró"""
+        if self.instantaneas is None or not nombres:
+            return []
+        inicio = time.perf_counter()
+        encontradas = self.instantaneas.cargar(nombres)
+        for nombre, (df, metadatos) in encontradas.items():
+            self._guardar_entrada(nombre, df, time.perf_counter() - inicio, metadatos.get('huella'),
+                                  desde_disco=metadatos.get('guardado', '?'))
+        return list(encontradas)
+
+    def _revalidar_en_segundo_plano(self, nombres, cargador):
+        def revalidar():
+            with self._lock:
+                # Si mientras tanto alguien más las confirmó, no hace falta descargarlas
+                pendientes = [nombre for nombre in nombres if self._hojas.get(nombre, {}).get('desde_disco')]
+            if not pendientes:
+                return
+            try:
+                self._descargar(pendientes, cargador)
+            except Exception as e:
+                with self._lock:
+                    self.error_conexion = str(e) or type(e).__name__
+
+        threading.Thread(target=revalidar, daemon=True).start()
+
+    def hojas_desde_disco(self):
+        """{nombre: fecha de la instantánea} de las hojas servidas desde disco sin confirmar todavía"""
+        with self._lock:
+            return {nombre: entrada['desde_disco'] for nombre, entrada in self._hojas.items() if entrada['desde_disco']}
+
+    def solo_lectura(self):
+        """True si el almacenamiento no responde o hay hojas de disco sin revalidar: no se debe escribir"""
+        return self.error_conexion is not None or bool(self.hojas_desde_disco())
+
+    def obtener(self, nombre, cargador):
+        """Devuelve la instantánea de una sola hoja, descargándola si venció"""
+        return self.obtener_varias([nombre], cargador)[nombre]
+
+    def derivado(self, clave, datos, hojas, construir, al_agregar=None, contexto=None):
+        """Resultado calculado a partir de `hojas` de la Instantanea `datos`; se recalcula si cambió su versión.
+
+        `construir` debe leer de esa misma Instantanea: el resultado queda
+        guardado con sus versiones, no con las vigentes en el almacén. Si otra
+        sesión ya recargó alguna hoja, el resultado se calcula para quien lo pidió
+        pero no reemplaza al de los datos actuales.
+
+        `contexto` es lo que, además de los datos, cambia el resultado (p. ej. el
+        año o la fecha de hoy): si difiere del guardado se recalcula y se reemplaza
+        la misma entrada, en lugar de acumular una clave por día.
+
+        Si se da `al_agregar(resultado, nombre_hoja, registro)`, las filas nuevas
+        escritas con `agregar_fila` se aplican al resultado en lugar de
+        reconstruirlo. El resultado se comparte entre sesiones igual que las
+        instantáneas: fuera de ese gancho no debe modificarse.
+        """
+        with self._lock:
+            versiones = tuple(datos.versiones[nombre] for nombre in hojas)
+            entrada = self._derivados.get(clave)
+            if entrada is not None and entrada['versiones'] == versiones and entrada['contexto'] == contexto:
+                return entrada['resultado']
+            resultado = construir()
+            if entrada is None or versiones == tuple(self.version_hoja(nombre) for nombre in hojas):
+                self._derivados[clave] = {'versiones': versiones, 'resultado': resultado, 'contexto': contexto,
+                                          'hojas': list(hojas), 'al_agregar': al_agregar}
+            return resultado
+
+    def _actualizar_derivados(self, nombre, version_previa, registro):
+        """Aplica una fila nueva a los derivados incrementales que estaban al día"""
+        for entrada in self._derivados.values():
+            if entrada['al_agregar'] is None or nombre not in entrada['hojas']:
+                continue
+            posicion = entrada['hojas'].index(nombre)
+            if entrada['versiones'][posicion] != version_previa:
+                continue
+            entrada['al_agregar'](entrada['resultado'], nombre, registro)
+            versiones = list(entrada['versiones'])
+            versiones[posicion] = self.version_hoja(nombre)
+            entrada['versiones'] = tuple(versiones)
+
+    def fila_de(self, nombre, valor, columna='ID'):
+        """Número de fila en la hoja (base 1) del primer registro con `valor` en `columna`, o None.
+
+        El mapa valor -> fila se arma una vez por versión de la hoja y las filas
+        agregadas con `agregar_fila` se le suman sin reconstruirlo, así que las
+        ediciones no necesitan descargar la columna para ubicar la fila.
+        """
+        with self._lock:
+            entrada = self._hojas.get(nombre)
+            if entrada is None or columna not in entrada['df'].columns:
+                return None
+
+            def construir():
+                filas = {}
+                for posicion, clave in enumerate(entrada['df'][columna].tolist()):
+                    filas.setdefault(clave, posicion + 2)
+                return filas
+
+            def al_agregar(filas, _, registro):
+                filas.setdefault(registro[columna], len(self._hojas[nombre]['df']) + 1)
+
+            return self.derivado(('filas', nombre, columna), self._instantanea([nombre]), [nombre], construir,
+                                 al_agregar=al_agregar).get(valor)
+
+    def version_hoja(self, nombre):
+        entrada = self._hojas.get(nombre)
+        return entrada['version'] if entrada else 0
+
+    def agregar_fila(self, nombre, valores, fila_asignada):
+        """Escritura directa: añade al caché la fila que acaba de escribirse en la hoja.
+
+        `fila_asignada` es el número de fila que devolvió la API. Si no coincide
+        con la siguiente fila esperada, otra sesión escribió en medio y la hoja
+        se invalida para resincronizarla completa. Devuelve True si se aplicó.
+        """
+        with self._lock:
+            entrada = self._hojas.get(nombre)
+            if entrada is None:
+                return False
+            df = entrada['df']
+            if fila_asignada != len(df) + 2 or len(valores) > len(df.columns):
+                self.invalidar(nombre)
+                return False
+            valores = list(valores) + [''] * (len(df.columns) - len(valores))
+            nueva = pd.DataFrame([valores], columns=df.columns)
+            version_previa = entrada['version']
+            # Las filas nuevas llegan como texto; se vuelven a tipar junto con el resto
+            df = self.normalizar(nombre, pd.concat([df.astype(object), nueva], ignore_index=True))
+            self._reemplazar(nombre, df)
+            self._actualizar_derivados(nombre, version_previa, df.iloc[-1].to_dict())
+            return True
+
+    def actualizar_celdas(self, nombre, ediciones):
+        """Escritura directa de celdas ya guardadas: `ediciones` es [(fila, columna, valor)] en base 1"""
+        with self._lock:
+            entrada = self._hojas.get(nombre)
+            if entrada is None:
+                return False
+            df = entrada['df']
+            if any(not (2 <= fila <= len(df) + 1 and 1 <= col <= len(df.columns)) for fila, col, _ in ediciones):
+                self.invalidar(nombre)
+                return False
+            # Copia superficial: con Copy-on-Write solo se duplican las columnas editadas,
+            # sin alterar el DataFrame que otras sesiones pueden estar leyendo
+            df = df.copy(deep=False)
+            for fila, col, valor in ediciones:
+                if df.dtypes.iloc[col - 1] != object:
+                    df[df.columns[col - 1]] = df[df.columns[col - 1]].astype(object)
+                df.iat[fila - 2, col - 1] = valor
+            self._reemplazar(nombre, self.normalizar(nombre, df))
+            return True
+
+    def _reemplazar(self, nombre, df):
+        self.version += 1
+        self._hojas[nombre]['df'] = df
+        self._hojas[nombre]['version'] = self.version
+        # Ya no coincide con lo descargado: la próxima descarga la publica como versión nueva
+        self._hojas[nombre]['huella'] = None
+
+    def marcar_vencidas(self, nombres):
+        """Las hojas se vuelven a descargar en la próxima lectura; mientras, la copia sigue sirviendo sin conexión"""
+        with self._lock:
+            for nombre in nombres:
+                if nombre in self._hojas:
+                    self._hojas[nombre]['cargado'] = float('-inf')
+
+    def invalidar(self, *nombres):
+        """Descarta las hojas indicadas (o todas) tras una escritura exitosa"""
+        with self._lock:
+            for nombre in (nombres or list(self._hojas)):
+                self._hojas.pop(nombre, None)
+            self.version += 1
+
+def leer_hoja(worksheet):
+    """Lee una hoja completa como DataFrame, con columnas por defecto si está vacía"""
+    df = pd.DataFrame(worksheet.get_all_records())
+    if len(df) == 0 and worksheet.title in COLUMNAS_POR_DEFECTO:
+        df = pd.DataFrame(columns=COLUMNAS_POR_DEFECTO[worksheet.title])
+    return df
+
+def entero_con_tipo(serie, tipo):
+    """Columna como entero anulable `tipo`, o Int64 si algún valor no cabe en él"""
+    numeros = pd.to_numeric(serie.replace('', None), errors='coerce').astype('Float64').round()
+    limites = np.iinfo('int64')
+    numeros = numeros.where((numeros >= limites.min) & (numeros <= limites.max))
+    limites = np.iinfo(tipo.lower())
+    if numeros.notna().any() and (numeros.min() < limites.min or numeros.max() > limites.max):
+        tipo = 'Int64'
+    return numeros.astype(tipo)
+
+def normalizar_hoja(nombre, df, compacto=False):
+    """Aplica ESQUEMAS[nombre]: fechas a datetime64, conteos e IDs a enteros y catálogos a categorías.
+
+    En modo compacto además usa enteros pequeños (Int32 para IDs, Int16 para
+    días) y convierte a categoría los textos repetidos; una columna con algún
+    valor fuera de ese rango (p. ej. una fecha con el año mal capturado) se
+    queda en Int64. Los valores que no se pueden convertir, o que no caben ni
+    en Int64, quedan como NaT/<NA>. Aplicarla a un DataFrame ya tipado no
+    cambia nada.
+    """
+    esquema = ESQUEMAS.get(nombre)
+    if not esquema:
+        return df
+    df = df.copy(deep=False)
+    tipos_enteros = (('enteros', 'Int32' if compacto else 'Int64'), ('dias', 'Int16' if compacto else 'Int64'))
+    for clave, tipo in tipos_enteros:
+        for col in esquema.get(clave, []):
+            if col in df.columns:
+                df[col] = entero_con_tipo(df[col], tipo)
+    for col in esquema.get('fechas', []):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col].replace('', None), errors='coerce')
+    categorias = esquema.get('categorias', []) + (esquema.get('repetidas', []) if compacto else [])
+    for col in categorias:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def memoria_df(df):
+    """Bytes que ocupa un DataFrame, contando el contenido de los textos"""
+    return int(df.memory_usage(deep=True).sum())
+
+def huella_df(df):
+    """Resumen estable del contenido de un DataFrame (columnas y valores) para saber si cambió"""
+    columnas = pd.util.hash_pandas_object(pd.Series([str(col) for col in df.columns], dtype=object), index=False)
+    valores = pd.util.hash_pandas_object(df, index=False) if len(df.columns) else columnas.iloc[0:0]
+    return f"{int(columnas.sum()) & 0xFFFFFFFFFFFFFFFF:016x}-{int(valores.sum()) & 0xFFFFFFFFFFFFFFFF:016x}-{len(df)}"
+
+# Tipo original de cada celda en las columnas mixtas guardadas como texto
+CONVERSIONES_INSTANTANEA = {'int': int, 'float': float, 'bool': lambda valor: valor == 'True'}
+
+def tipo_de_celda(valor):
+    if isinstance(valor, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(valor, (int, np.integer)):
+        return 'int'
+    if isinstance(valor, (float, np.floating)) and not math.isnan(valor):
+        return 'float'
+    return None
+
+class InstantaneasDisco:
+    """Última versión descargada de cada hoja, guardada en Parquet con sus metadatos.
+
+    Por hoja hay un `<nombre>.parquet` con el DataFrame tal como lo entregó el
+    almacenamiento (antes de tiparlo) y un `<nombre>.json` con la huella del
+    contenido, el número de filas y la fecha en que se guardó. Las columnas que
+    mezclan números y textos (get_all_records las deja así) se guardan como
+    texto más una columna auxiliar con el tipo de cada celda, y se restauran
+    igual al leerlas. Requiere pyarrow; si falta o un archivo está dañado, la
+    hoja simplemente no tiene instantánea.
+    """
+
+    PREFIJO_TIPOS = '__tipo__'
+
+    def __init__(self, carpeta=CARPETA_INSTANTANEAS):
+        self.carpeta = carpeta
+        self._huellas = {}
+
+    def _ruta(self, nombre, extension):
+        return os.path.join(self.carpeta, f"{nombre}.{extension}")
+
+    def guardar(self, nombre, df, huella):
+        """Escribe la instantánea si cambió desde la última; devuelve True si quedó guardada"""
+        if self._huellas.get(nombre) == huella:
+            return True
+        try:
+            os.makedirs(self.carpeta, exist_ok=True)
+            tabla = df.copy(deep=False)
+            for col in df.columns:
+                if df[col].dtype != object:
+                    continue
+                tipos = [tipo_de_celda(valor) for valor in df[col].tolist()]
+                if any(tipos):
+                    tabla[col] = [None if pd.isna(valor) else str(valor) for valor in df[col].tolist()]
+                    tabla[self.PREFIJO_TIPOS + col] = tipos
+            metadatos = {'hoja': nombre, 'huella': huella, 'filas': len(df),
+                         'guardado': datetime.now().isoformat(timespec='seconds')}
+            # Se escribe a un temporal y se renombra, para no dejar nunca un archivo a medias
+            tabla.to_parquet(self._ruta(nombre, 'parquet.tmp'), index=False)
+            with open(self._ruta(nombre, 'json.tmp'), 'w', encoding='utf-8') as archivo:
+                json.dump(metadatos, archivo)
+            os.replace(self._ruta(nombre, 'parquet.tmp'), self._ruta(nombre, 'parquet'))
+            os.replace(self._ruta(nombre, 'json.tmp'), self._ruta(nombre, 'json'))
+        except Exception:
+            return False
+        self._huellas[nombre] = huella
+        return True
+
+    def cargar(self, nombres):
+        """{nombre: (DataFrame, metadatos)} de las hojas que tienen instantánea legible"""
+        resultado = {}
+        for nombre in nombres:
+            try:
+                with open(self._ruta(nombre, 'json'), encoding='utf-8') as archivo:
+                    metadatos = json.load(archivo)
+                df = pd.read_parquet(self._ruta(nombre, 'parquet'))
+                for auxiliar in [col for col in df.columns if col.startswith(self.PREFIJO_TIPOS)]:
+                    col = auxiliar[len(self.PREFIJO_TIPOS):]
+                    tipos = df.pop(auxiliar).tolist()
+                    df[col] = pd.Series([
+                        CONVERSIONES_INSTANTANEA[tipo](valor) if isinstance(tipo, str) else (None if pd.isna(valor) else valor)
+                        for valor, tipo in zip(df[col].astype(object).tolist(), tipos)
+                    ], dtype=object)
+            except Exception:
+                continue
+            self._huellas[nombre] = metadatos.get('huella')
+            resultado[nombre] = (df, metadatos)
+        return resultado
+
+def fila_de_respuesta(respuesta):
+    """Número de fila donde la API escribió un append_row (p. ej. 'Solicitudes!A15:L15' -> 15)"""
+    rango = respuesta.get('updates', {}).get('updatedRange', '')
+    coincidencia = re.search(r'![A-Z]+(\d+)', rango)
+    return int(coincidencia.group(1)) if coincidencia else None
+
+def cargar_hojas_en_paralelo(pool, nombres):
+    """Descarga varias hojas al mismo tiempo y devuelve {nombre: (DataFrame, segundos)}.
+
+    Las hojas salen del pool (sin pedir metadatos otra vez); cada una se lee en
+    su propio hilo, así que la espera total se acerca a la de la hoja más lenta.
+    """
+    for nombre in nombres:
+        pool.hoja(nombre)
+
+    def leer_con_tiempo(nombre):
+        inicio = time.perf_counter()
+        df = pool.ejecutar(nombre, leer_hoja, clave=('get_all_records', nombre))
+        return df, time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=len(nombres)) as executor:
+        futuros = {nombre: executor.submit(leer_con_tiempo, nombre) for nombre in nombres}
+        return {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+# ============= PLANIFICADOR DE CUOTA =============
+def es_error_reintentable(error, escritura=False):
+    """429 siempre se reintenta; los 5xx solo en lecturas, porque una escritura pudo haberse aplicado"""
+    if not isinstance(error, gspread.exceptions.APIError):
+        return False
+    estado = getattr(getattr(error, 'response', None), 'status_code', None)
+    if estado == 429:
+        return True
+    return not escritura and estado is not None and estado >= 500
+
+class PlanificadorSheets:
+    """Punto único por el que pasan todas las llamadas a la API de Google Sheets.
+
+    Lleva una ventana móvil de 60 s por tipo de llamada (lectura/escritura) y,
+    si se agota la cuota, espera a que se libere en lugar de fallar. Los errores
+    429/5xx se reintentan con espera exponencial y jitter, y las lecturas
+    idénticas que ya están en curso se combinan en una sola llamada.
+    """
+
+    def __init__(self, lecturas_por_minuto=CUOTA_LECTURAS_POR_MINUTO,
+                 escrituras_por_minuto=CUOTA_ESCRITURAS_POR_MINUTO,
+                 max_reintentos=5, espera_base=1.0):
+        self.limites = {'lectura': lecturas_por_minuto, 'escritura': escrituras_por_minuto}
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.contadores = {
+            'lecturas': 0, 'escrituras': 0, 'reintentos': 0, 'esperas_por_cuota': 0,
+            'lecturas_combinadas': 0, 'errores': 0, 'pico_lecturas': 0, 'pico_escrituras': 0
+        }
+        self._ventanas = {'lectura': deque(), 'escritura': deque()}
+        self._en_curso = {}
+        self._lock = threading.Lock()
+
+    def _limpiar_ventana(self, tipo, ahora):
+        ventana = self._ventanas[tipo]
+        while ventana and ahora - ventana[0] >= 60:
+            ventana.popleft()
+        return ventana
+
+    def _reservar(self, tipo):
+        """Bloquea hasta que haya cupo en la ventana del último minuto"""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                ventana = self._limpiar_ventana(tipo, ahora)
+                if len(ventana) < self.limites[tipo]:
+                    ventana.append(ahora)
+                    clave_pico = 'pico_lecturas' if tipo == 'lectura' else 'pico_escrituras'
+                    self.contadores[clave_pico] = max(self.contadores[clave_pico], len(ventana))
+                    return
+                espera = 60 - (ahora - ventana[0])
+                self.contadores['esperas_por_cuota'] += 1
+            time.sleep(max(espera, 0.05))
+
+    def _con_reintentos(self, tipo, operacion):
+        escritura = tipo == 'escritura'
+        for intento in range(self.max_reintentos + 1):
+            self._reservar(tipo)
+            try:
+                return operacion()
+            except Exception as e:
+                if intento == self.max_reintentos or not es_error_reintentable(e, escritura):
+                    with self._lock:
+                        self.contadores['errores'] += 1
+                    raise
+                with self._lock:
+                    self.contadores['reintentos'] += 1
+                time.sleep(self.espera_base * 2 ** intento + random.uniform(0, self.espera_base))
+
+    def leer(self, operacion, clave=None):
+        """Ejecuta una lectura; con `clave`, otra lectura igual en curso comparte el resultado"""
+        if clave is None:
+            with self._lock:
+                self.contadores['lecturas'] += 1
+            return self._con_reintentos('lectura', operacion)
+
+        with self._lock:
+            futuro = self._en_curso.get(clave)
+            propia = futuro is None
+            if propia:
+                futuro = Future()
+                self._en_curso[clave] = futuro
+                self.contadores['lecturas'] += 1
+            else:
+                self.contadores['lecturas_combinadas'] += 1
+        if not propia:
+            return futuro.result()
+
+        try:
+            resultado = self._con_reintentos('lectura', operacion)
+            futuro.set_result(resultado)
+            return resultado
+        except Exception as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+
+    def escribir(self, operacion):
+        with self._lock:
+            self.contadores['escrituras'] += 1
+        return self._con_reintentos('escritura', operacion)
+
+    def uso_actual(self):
+        """Llamadas del último minuto por tipo, junto con su límite"""
+        with self._lock:
+            ahora = time.monotonic()
+            return {tipo: (len(self._limpiar_ventana(tipo, ahora)), self.limites[tipo]) for tipo in self.limites}
+
+# ============= POOL DE CONEXIONES =============
+def es_error_de_autenticacion(error):
+    if isinstance(error, RefreshError):
+        return True
+    respuesta = getattr(error, 'response', None)
+    return isinstance(error, gspread.exceptions.APIError) and getattr(respuesta, 'status_code', None) == 401
+
+class PoolHojas:
+    """Cliente, libro y hojas de gspread reutilizables por todo el proceso.
+
+    Las credenciales se autorizan una vez y los objetos Spreadsheet/Worksheet se
+    guardan por título. Solo se renuevan cuando vence la autenticación o cuando
+    una hoja no aparece (WorksheetNotFound). Toda llamada a la API pasa por el
+    planificador de cuota.
+    """
+
+    def __init__(self, conectar, planificador, nombre_libro=SPREADSHEET_NAME):
+        self._conectar = conectar
+        self.planificador = planificador
+        self.nombre_libro = nombre_libro
+        self._client = None
+        self._spreadsheet = None
+        self._hojas = {}
+        self._lock = threading.RLock()
+
+    def libro(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                if self._client is None:
+                    self._client = self._conectar()
+                    if self._client is None:
+                        raise ConnectionError("No se pudo conectar a Google Sheets")
+                self._spreadsheet = self.planificador.leer(
+                    lambda: self._client.open(self.nombre_libro), clave=('open', self.nombre_libro)
+                )
+            return self._spreadsheet
+
+    def hoja(self, titulo):
+        """Worksheet por título; si no está en el pool se refresca la lista una sola vez"""
+        with self._lock:
+            if titulo not in self._hojas:
+                libro = self.libro()
+                hojas = self.planificador.leer(libro.worksheets, clave=('worksheets', self.nombre_libro))
+                self._hojas = {ws.title: ws for ws in hojas}
+            if titulo not in self._hojas:
+                raise gspread.WorksheetNotFound(titulo)
+            return self._hojas[titulo]
+
+    def ejecutar(self, titulo, operacion, escritura=False, clave=None):
+        """Ejecuta `operacion(worksheet)` a través del planificador.
+
+        Si la autenticación venció, reconecta y reintenta una vez. `clave` permite
+        combinar lecturas idénticas que estén en curso al mismo tiempo.
+        """
+        def llamar():
+            ws = self.hoja(titulo)
+            if escritura:
+                return self.planificador.escribir(lambda: operacion(ws))
+            return self.planificador.leer(lambda: operacion(ws), clave=clave)
+
+        try:
+            return llamar()
+        except Exception as e:
+            if not es_error_de_autenticacion(e):
+                raise
+            self.reiniciar()
+            return llamar()
+
+    def ejecutar_en_libro(self, operacion):
+        """Escritura sobre el libro completo (p. ej. values_batch_update con rangos de varias hojas).
+
+        Pasa por el planificador como una sola escritura y, como `ejecutar`,
+        reconecta y reintenta una vez si venció la autenticación.
+        """
+        def llamar():
+            libro = self.libro()
+            return self.planificador.escribir(lambda: operacion(libro))
+
+        try:
+            return llamar()
+        except Exception as e:
+            if not es_error_de_autenticacion(e):
+                raise
+            self.reiniciar()
+            return llamar()
+
+    def reiniciar(self):
+        with self._lock:
+            self._client = None
+            self._spreadsheet = None
+            self._hojas = {}
+
+# ============= COLA DE ESCRITURAS =============
+def agrupar_celdas_en_rangos(ediciones):
+    """Convierte [(fila, columna, valor)] en rangos A1 para batch_update.
+
+    Las celdas consecutivas de una misma columna se juntan en un solo rango
+    (p. ej. M2:M40), así una columna completa viaja como un bloque.
+    """
+    por_columna = {}
+    for fila, col, valor in ediciones:
+        por_columna.setdefault(col, {})[fila] = valor
+
+    rangos = []
+    for col, celdas in sorted(por_columna.items()):
+        filas = sorted(celdas)
+        inicio = filas[0]
+        for i, fila in enumerate(filas):
+            fin_de_bloque = i == len(filas) - 1 or filas[i + 1] != fila + 1
+            if fin_de_bloque:
+                rango = gspread.utils.rowcol_to_a1(inicio, col)
+                if fila != inicio:
+                    rango += ':' + gspread.utils.rowcol_to_a1(fila, col)
+                rangos.append({'range': rango, 'values': [[celdas[f]] for f in range(inicio, fila + 1)]})
+                if i < len(filas) - 1:
+                    inicio = filas[i + 1]
+    return rangos
+
+class ColaEscrituras:
+    """Acumula filas nuevas y ediciones de celdas por hoja y las envía en bloque.
+
+    Cada hoja se vacía con un solo `agregar_filas` y un solo `editar_celdas` del
+    almacenamiento (en Sheets, un `append_rows` y un `values_batch_update`), ya sea
+    cuando alguien lo pide con `vaciar()` o tras un intervalo corto. Cada
+    operación devuelve un Future: para filas nuevas el resultado es el número de
+    fila asignado, para ediciones es True. Al terminar se aplica la escritura
+    directa en el almacén compartido.
+    """
+
+    def __init__(self, almacenamiento, almacen, intervalo_segundos=INTERVALO_COLA_SEGUNDOS):
+        self.almacenamiento = almacenamiento
+        self.almacen = almacen
+        self.intervalo_segundos = intervalo_segundos
+        self.contadores = {'operaciones': 0, 'llamadas': 0}
+        self._pendientes = {}
+        self._temporizador = None
+        self._lock = threading.Lock()
+        self._lock_vaciado = threading.Lock()
+
+    def _pendientes_de(self, titulo):
+        return self._pendientes.setdefault(titulo, {'filas': [], 'celdas': []})
+
+    def agregar_fila(self, titulo, valores):
+        futuro = Future()
+        with self._lock:
+            self._pendientes_de(titulo)['filas'].append((list(valores), futuro))
+            self.contadores['operaciones'] += 1
+        self._programar()
+        return futuro
+
+    def editar_celdas(self, titulo, ediciones):
+        """Encola [(fila, columna, valor)] en base 1; un solo Future para todo el grupo"""
+        futuro = Future()
+        with self._lock:
+            self._pendientes_de(titulo)['celdas'].append((list(ediciones), futuro))
+            self.contadores['operaciones'] += len(ediciones)
+        self._programar()
+        return futuro
+
+    def _programar(self):
+        with self._lock:
+            if self._temporizador is None:
+                self._temporizador = threading.Timer(self.intervalo_segundos, self.vaciar)
+                self._temporizador.daemon = True
+                self._temporizador.start()
+
+    def vaciar(self, titulo=None):
+        """Envía ya lo pendiente (de una hoja o de todas) y resuelve sus Futures"""
+        with self._lock_vaciado:
+            with self._lock:
+                titulos = [titulo] if titulo else list(self._pendientes)
+                lotes = {t: self._pendientes.pop(t) for t in titulos if t in self._pendientes}
+                if not self._pendientes and self._temporizador is not None:
+                    self._temporizador.cancel()
+                    self._temporizador = None
+            for titulo_lote, lote in lotes.items():
+                self._enviar_filas(titulo_lote, lote['filas'])
+                self._enviar_celdas(titulo_lote, lote['celdas'])
+
+    def _enviar_filas(self, titulo, filas):
+        if not filas:
+            return
+        valores = [fila for fila, _ in filas]
+        try:
+            primera = self.almacenamiento.agregar_filas(titulo, valores)
+            self.contadores['llamadas'] += 1
+        except Exception as e:
+            for _, futuro in filas:
+                futuro.set_exception(e)
+            return
+        try:
+            for i, (fila, futuro) in enumerate(filas):
+                asignada = primera + i if primera is not None else None
+                self._aplicar_en_almacen(titulo, lambda: self.almacen.agregar_fila(titulo, fila, asignada))
+                futuro.set_result(asignada)
+        finally:
+            self._resolver_pendientes(titulo, filas)
+
+    def _enviar_celdas(self, titulo, grupos):
+        if not grupos:
+            return
+        ediciones = [edicion for grupo, _ in grupos for edicion in grupo]
+        try:
+            self.almacenamiento.editar_celdas(titulo, ediciones)
+            self.contadores['llamadas'] += 1
+        except Exception as e:
+            for _, futuro in grupos:
+                futuro.set_exception(e)
+            return
+        try:
+            self._aplicar_en_almacen(titulo, lambda: self.almacen.actualizar_celdas(titulo, ediciones))
+            for _, futuro in grupos:
+                futuro.set_result(True)
+        finally:
+            self._resolver_pendientes(titulo, grupos)
+
+    def _aplicar_en_almacen(self, titulo, aplicar):
+        """Escritura directa en la caché; si falla, los datos ya están guardados y solo se invalida la hoja"""
+        try:
+            aplicar()
+        except Exception as e:
+            log.warning("No se pudo aplicar la escritura de %s en la caché: %s", titulo, e)
+            self.almacen.invalidar(titulo)
+
+    @staticmethod
+    def _resolver_pendientes(titulo, pendientes):
+        # Ningún Future puede quedar sin resolver: quien espera en result() se quedaría bloqueado
+        for _, futuro in pendientes:
+            if not futuro.done():
+                futuro.set_exception(RuntimeError(f"La escritura en {titulo} no terminó de procesarse"))
+
+# ============= ALMACENAMIENTO =============
+# Dos implementaciones con la misma interfaz (leer, agregar_filas, editar_celdas,
+# reemplazar_hoja, versiones). Las filas se numeran como en la hoja: la primera de datos es la 2.
+# Cada escritura cambia la versión de su hoja; `versiones_propias` guarda las que
+# escribió este proceso, para no recargar lo que ya aplicó la escritura directa.
+
+# Fallas de la API, de las credenciales o de la red que no deben tumbar una operación secundaria (versiones)
+ERRORES_DE_CONEXION = (gspread.exceptions.APIError, GoogleAuthError, ConnectionError, OSError, sqlite3.Error)
+
+def nueva_version():
+    """Marca única de una escritura (no hace falta leer la anterior para cambiarla)"""
+    return f"{datetime.now():%Y%m%d%H%M%S}-{random.getrandbits(32):08x}"
+
+class AlmacenamientoSheets:
+    """Google Sheets a través del pool de hojas (con cuota y reintentos)"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.versiones_propias = set()
+        self._hoja_versiones_lista = False
+
+    def leer(self, nombres):
+        """{nombre: (DataFrame, segundos)}, descargando las hojas en paralelo"""
+        return cargar_hojas_en_paralelo(self.pool, nombres)
+
+    def agregar_filas(self, titulo, filas):
+        """Añade las filas al final y devuelve el número de la primera (o None si no se pudo saber)"""
+        respuesta = self.pool.ejecutar(titulo, lambda ws: ws.append_rows(filas), escritura=True)
+        self.marcar_cambio(titulo)
+        return fila_de_respuesta(respuesta)
+
+    def editar_celdas(self, titulo, ediciones):
+        """[(fila, columna, valor)] en base 1, en un solo values_batch_update que incluye la nueva versión"""
+        rangos = [{'range': gspread.utils.absolute_range_name(titulo, rango['range']), 'values': rango['values']}
+                  for rango in agrupar_celdas_en_rangos(ediciones)]
+        version, rangos_version = self._rangos_version(titulo)
+        self.pool.ejecutar_en_libro(lambda libro: libro.values_batch_update(
+            {'valueInputOption': 'RAW', 'data': rangos + rangos_version}
+        ))
+        if version:
+            self.versiones_propias.add(version)
+
+    def _hoja_o_crear(self, titulo, filas, columnas):
+        try:
+            return self.pool.hoja(titulo)
+        except gspread.WorksheetNotFound:
+            libro = self.pool.libro()
+            self.pool.planificador.escribir(lambda: libro.add_worksheet(title=titulo, rows=filas, cols=columnas))
+            return self.pool.hoja(titulo)
+
+    def reemplazar_hoja(self, titulo, df):
+        """Sobrescribe la hoja completa con `df` (encabezados + filas); la crea si no existe.
+
+        Primero se escriben los datos nuevos y después se recortan las filas y
+        columnas sobrantes: si la escritura falla, la hoja conserva lo que tenía.
+        """
+        valores = [list(df.columns)] + df.astype(object).where(df.notna(), '').values.tolist()
+        columnas = max(len(df.columns), 1)
+        ws = self._hoja_o_crear(titulo, max(len(valores), 100), columnas)
+        # row_count puede haberse quedado corto (append_rows no lo actualiza); add_rows/add_cols
+        # solo agregan, así que nunca borran filas aunque el dato esté desfasado
+        if ws.row_count < len(valores):
+            self.pool.ejecutar(titulo, lambda hoja: hoja.add_rows(len(valores) - hoja.row_count), escritura=True)
+        if ws.col_count < columnas:
+            self.pool.ejecutar(titulo, lambda hoja: hoja.add_cols(columnas - hoja.col_count), escritura=True)
+        self.pool.ejecutar(titulo, lambda hoja: hoja.update(range_name='A1', values=valores), escritura=True)
+        self.pool.ejecutar(titulo, lambda hoja: hoja.resize(rows=len(valores), cols=columnas), escritura=True)
+        self.marcar_cambio(titulo)
+
+    def versiones(self):
+        """{hoja: versión} leídas de HOJA_VERSIONES con una sola lectura pequeña ({} si aún no existe)"""
+        try:
+            filas = self.pool.ejecutar(HOJA_VERSIONES, lambda ws: ws.get('A2:B'), clave=('versiones',))
+        except gspread.WorksheetNotFound:
+            return {}
+        return {fila[0]: fila[1] for fila in filas if len(fila) >= 2}
+
+    def _rangos_version(self, titulo):
+        """(versión nueva, rangos de HOJA_VERSIONES que la escriben) para `titulo`; (None, []) si no aplica.
+
+        La hoja de control se busca (y si hace falta se crea) una sola vez por
+        proceso; si eso falla, la escritura de datos sigue sin versión.
+        """
+        if titulo not in HOJAS_DATOS:
+            return None, []
+        if not self._hoja_versiones_lista:
+            try:
+                self._hoja_o_crear(HOJA_VERSIONES, len(HOJAS_DATOS) + 1, 3)
+            except ERRORES_DE_CONEXION as e:
+                log.warning("No se pudo preparar la hoja %s: %s", HOJA_VERSIONES, e)
+                return None, []
+            self._hoja_versiones_lista = True
+        version = nueva_version()
+        fila = HOJAS_DATOS.index(titulo) + 2
+        return version, [
+            {'range': gspread.utils.absolute_range_name(HOJA_VERSIONES, 'A1:C1'),
+             'values': [['Hoja', 'Version', 'Actualizado']]},
+            {'range': gspread.utils.absolute_range_name(HOJA_VERSIONES, f'A{fila}:C{fila}'),
+             'values': [[titulo, version, datetime.now().strftime('%Y-%m-%d %H:%M:%S')]]},
+        ]
+
+    def marcar_cambio(self, titulo):
+        """Escribe una versión nueva para `titulo` tras un append o un reemplazo completo.
+
+        La escritura de datos ya se hizo, así que cualquier falla aquí solo se
+        registra: si llegara a quien escribió, la escritura parecería fallida y
+        podría enviarse dos veces. Las demás sesiones verán el cambio cuando venza su TTL.
+        """
+        try:
+            version, rangos = self._rangos_version(titulo)
+            if not version:
+                return
+            self.pool.ejecutar_en_libro(lambda libro: libro.values_batch_update({'valueInputOption': 'RAW', 'data': rangos}))
+        except Exception as e:
+            log.warning("No se pudo registrar la versión de %s: %s", titulo, e)
+            return
+        self.versiones_propias.add(version)
+
+def citar(nombre):
+    """Identificador de SQLite entre comillas (las columnas tienen espacios y acentos)"""
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+class AlmacenamientoSQLite:
+    """Base de datos SQLite local con la misma interfaz que AlmacenamientoSheets.
+
+    Cada hoja es una tabla con sus mismas columnas más `_fila`, el número de fila
+    equivalente en la hoja, de modo que la caché, la cola y el mapa ID -> fila
+    funcionan igual. Las tablas se crean al importarlas con `reemplazar_hoja`.
+    Las columnas de COLUMNAS_INDEXADAS llevan índice, para que las consultas
+    directas sobre la base (p. ej. desde el cliente sqlite3) filtren por
+    empleado, tipo, fechas o estado sin recorrer la tabla.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        # Versión por tabla, en la misma transacción que cada escritura
+        with self._conexion:
+            self._conexion.execute(
+                f'CREATE TABLE IF NOT EXISTS {citar(HOJA_VERSIONES)} (hoja TEXT PRIMARY KEY, version TEXT, actualizado TEXT)'
+            )
+        self.versiones_propias = set()
+        self._lock = threading.RLock()
+
+    def existe(self, titulo):
+        with self._lock:
+            return self._conexion.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (titulo,)
+            ).fetchone() is not None
+
+    def columnas(self, titulo):
+        with self._lock:
+            info = self._conexion.execute(f'PRAGMA table_info({citar(titulo)})').fetchall()
+        return [col[1] for col in info if col[1] != '_fila']
+
+    def _crear_tabla(self, titulo, columnas):
+        """Tabla e índices; no confirma, corre dentro de la transacción de quien la llama"""
+        # Columnas sin tipo declarado: SQLite guarda cada valor con el tipo con que llega
+        # Una hoja sin encabezados queda como tabla con solo `_fila`
+        definicion = ', '.join(['_fila INTEGER PRIMARY KEY'] + [citar(col) for col in columnas])
+        self._conexion.execute(f'CREATE TABLE {citar(titulo)} ({definicion})')
+        for col in COLUMNAS_INDEXADAS:
+            if col in columnas:
+                self._conexion.execute(
+                    f'CREATE INDEX {citar("idx_" + titulo + "_" + col)} ON {citar(titulo)} ({citar(col)})'
+                )
+
+    def leer(self, nombres):
+        resultado = {}
+        for nombre in nombres:
+            inicio = time.perf_counter()
+            if not self.existe(nombre):
+                raise LookupError(f"La tabla {nombre} no existe en {self.ruta}")
+            with self._lock:
+                df = pd.read_sql_query(f'SELECT * FROM {citar(nombre)} ORDER BY _fila', self._conexion)
+            resultado[nombre] = (df.drop(columns='_fila'), time.perf_counter() - inicio)
+        return resultado
+
+    def agregar_filas(self, titulo, filas):
+        columnas = self.columnas(titulo)
+        if any(len(fila) > len(columnas) for fila in filas):
+            raise ValueError(f"Hay filas con más valores que columnas en {titulo}")
+        destino = ', '.join(['_fila'] + [citar(c) for c in columnas])
+        marcas = ', '.join('?' for _ in range(len(columnas) + 1))
+        with self._lock, self._conexion:
+            primera = self._conexion.execute(f'SELECT COALESCE(MAX(_fila), 1) + 1 FROM {citar(titulo)}').fetchone()[0]
+            self._conexion.executemany(
+                f'INSERT INTO {citar(titulo)} ({destino}) VALUES ({marcas})',
+                [[primera + i] + list(fila) + [''] * (len(columnas) - len(fila)) for i, fila in enumerate(filas)]
+            )
+            self._marcar_cambio(titulo)
+        return primera
+
+    def editar_celdas(self, titulo, ediciones):
+        columnas = self.columnas(titulo)
+        with self._lock, self._conexion:
+            for fila, col, valor in ediciones:
+                self._conexion.execute(
+                    f'UPDATE {citar(titulo)} SET {citar(columnas[col - 1])} = ? WHERE _fila = ?', (valor, fila)
+                )
+            self._marcar_cambio(titulo)
+
+    def reemplazar_hoja(self, titulo, df):
+        """Reemplaza la tabla completa con `df` (se usa para importar desde Sheets)"""
+        valores = df.astype(object).where(df.notna(), None).values.tolist()
+        with self._lock:
+            # Todo en una transacción explícita: si algo falla, la tabla anterior queda intacta
+            self._conexion.execute('BEGIN')
+            with self._conexion:
+                self._conexion.execute(f'DROP TABLE IF EXISTS {citar(titulo)}')
+                self._crear_tabla(titulo, list(df.columns))
+                self._conexion.executemany(
+                    f'INSERT INTO {citar(titulo)} VALUES ({", ".join("?" for _ in range(len(df.columns) + 1))})',
+                    [[i + 2] + fila for i, fila in enumerate(valores)]
+                )
+                self._marcar_cambio(titulo)
+
+    def _marcar_cambio(self, titulo):
+        version = nueva_version()
+        self._conexion.execute(
+            f'INSERT OR REPLACE INTO {citar(HOJA_VERSIONES)} VALUES (?, ?, ?)',
+            (titulo, version, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        )
+        self.versiones_propias.add(version)
+
+    def versiones(self):
+        with self._lock:
+            return dict(self._conexion.execute(f'SELECT hoja, version FROM {citar(HOJA_VERSIONES)}').fetchall())
+
+def copiar_hojas(origen, destino, nombres, prefijo=''):
+    """Copia hojas completas de un almacenamiento a otro (importar a SQLite o exportar el espejo a Sheets).
+
+    Con `prefijo`, cada hoja se escribe en el destino como `prefijo + nombre`.
+    """
+    for nombre, (df, _) in origen.leer(nombres).items():
+        destino.reemplazar_hoja(prefijo + nombre, df)
+
+class DetectorCambios:
+    """Detecta escrituras de otras sesiones o procesos sin descargar las hojas.
+
+    Las hojas deben cargarse con `cargar`, que anota la versión de cada una
+    vigente al descargarla (leída antes de los datos, así que a lo más sobra una
+    recarga). `revisar()` lee las versiones del almacenamiento (en Sheets, un
+    rango pequeño de HOJA_VERSIONES) como mucho una vez por intervalo y marca
+    como vencidas solo las hojas cuya versión cambió, de modo que la siguiente
+    lectura del almacén descarga únicamente esas.
+
+    Un cambio se ignora solo si tanto la versión anterior como la nueva las
+    escribió este proceso: la escritura directa ya lo aplicó. Si la anterior era
+    de otro, pudo haber una escritura ajena justo antes de la propia y la hoja se
+    recarga. Queda un hueco: una escritura ajena entre dos escrituras propias
+    seguidas, sin una revisión entre ellas, se ve hasta que vence el TTL. Lo
+    mismo pasa con las ediciones hechas a mano en la hoja, que no cambian la
+    versión.
+    """
+
+    def __init__(self, almacenamiento, almacen, intervalo_segundos=INTERVALO_REVISION_SEGUNDOS):
+        self.almacenamiento = almacenamiento
+        self.almacen = almacen
+        self.intervalo_segundos = intervalo_segundos
+        self.contadores = {'revisiones': 0, 'hojas_recargadas': 0}
+        self._vistas = {}
+        self._ultima = float('-inf')
+        self._lock = threading.Lock()
+
+    def cargar(self, nombres):
+        """Cargador para el almacén: lee las hojas y anota la versión con la que se descargaron"""
+        try:
+            actuales = self.almacenamiento.versiones()
+        except ERRORES_DE_CONEXION as e:
+            log.warning("No se pudieron leer las versiones: %s", e)
+            actuales = None
+        resultado = self.almacenamiento.leer(nombres)
+        with self._lock:
+            for nombre in resultado:
+                if actuales is None:
+                    # Sin versión de referencia: no se puede comparar hasta la próxima descarga
+                    self._vistas.pop(nombre, None)
+                else:
+                    self._vistas[nombre] = actuales.get(nombre)
+        return resultado
+
+    def revisar(self):
+        """Devuelve las hojas que cambiaron desde que se descargaron (ya marcadas como vencidas)"""
+        with self._lock:
+            if time.monotonic() - self._ultima < self.intervalo_segundos:
+                return []
+            self._ultima = time.monotonic()
+        try:
+            actuales = self.almacenamiento.versiones()
+        except ERRORES_DE_CONEXION as e:
+            # Sin conexión: la carga normal decide si se trabaja con la copia local
+            log.warning("No se pudieron revisar las versiones: %s", e)
+            return []
+        propias = self.almacenamiento.versiones_propias
+        with self._lock:
+            self.contadores['revisiones'] += 1
+            cambiadas = []
+            for nombre, vista in self._vistas.items():
+                version = actuales.get(nombre)
+                if version != vista and not (version in propias and vista in propias):
+                    cambiadas.append(nombre)
+                self._vistas[nombre] = version
+            self.contadores['hojas_recargadas'] += len(cambiadas)
+        self.almacen.marcar_vencidas(cambiadas)
+        return cambiadas
+
+# ============= CÁLCULOS Y REPORTES =============
+def calcular_saldos(df_emp, df_sol, dias_anuales=DIAS_ECONOMICOS_ANUALES, año=None):
+    """Días económicos usados y disponibles de TODOS los empleados en un año, con un solo groupby"""
+    año = año or datetime.now().year
+    economicos = df_sol[df_sol['Tipo Permiso'] == 'economico']
+    del_año = economicos[economicos['Fecha Registro'].dt.year == año]
+    
+    usados = del_año['Dias Solicitados'].groupby(del_año['EmpleadoID']).sum()
+    
+    saldos = pd.DataFrame({'ID': df_emp['ID'].to_numpy()})
+    saldos['DIAS_USADOS'] = saldos['ID'].map(usados).fillna(0).astype(int)
+    saldos['DIAS_REALES'] = dias_anuales - saldos['DIAS_USADOS']
+    return saldos
+
+def cargar_datos_con_calculo(sheet_emp, sheet_sol):
+    """Carga datos y CALCULA días disponibles en tiempo real"""
+    df_emp = normalizar_hoja('Empleados', pd.DataFrame(sheet_emp.get_all_records()))
+    df_sol = normalizar_hoja('Solicitudes', pd.DataFrame(sheet_sol.get_all_records()))
+    df_emp['DIAS_REALES'] = calcular_saldos(df_emp, df_sol)['DIAS_REALES'].to_numpy()
+    return df_emp, df_sol
+
+def conciliar_dias_disponibles(df_emp, df_sol):
+    """Celdas de la columna M (días disponibles) de Empleados que deben cambiar: [(fila, 13, valor)].
+
+    Disponibles = DIAS TOTALES (columna N) - días de solicitudes aprobadas del
+    RFC (columna B). Se compara contra lo que ya tiene la hoja y solo se
+    devuelven las celdas distintas, en base 1 como las usa la cola.
+    """
+    aprobadas = df_sol[df_sol['Aprobado Por'].notna() & (df_sol['Aprobado Por'] != '')]
+    dias_usados = aprobadas.groupby('RFC', observed=True)['Dias Solicitados'].sum().to_dict()
+    
+    totales = pd.to_numeric(df_emp.iloc[:, 13], errors='coerce')
+    usados = df_emp.iloc[:, 1].map(dias_usados).fillna(0).astype(int)
+    disponibles = np.where(totales.isna(), 0, totales.fillna(0).astype(int) - usados)
+    actuales = pd.to_numeric(df_emp.iloc[:, 12], errors='coerce').to_numpy()
+    
+    cambian = np.flatnonzero(actuales != disponibles)
+    return [(int(pos) + 2, 13, int(disponibles[pos])) for pos in cambian]
+
+class IndiceLicencias:
+    """Historial de licencias por (EmpleadoID, Tipo Permiso), construido una vez por versión de datos.
+
+    Guarda las fechas ordenadas, el conteo por año de registro
+    y la última fecha de fin, para que las reglas de validación se respondan
+    con búsquedas en diccionario en lugar de recorrer todas las solicitudes.
+    """
+
+    def __init__(self, df_sol):
+        self._entradas = {}
+        if len(df_sol) == 0:
+            return
+        datos = pd.DataFrame({
+            'emp': df_sol['EmpleadoID'],
+            'tipo': df_sol['Tipo Permiso'],
+            'inicio': df_sol['Fecha Inicio'],
+            'fin': df_sol['Fecha Fin'],
+            'registro': df_sol['Fecha Registro']
+        })
+        for (emp_id, tipo), grupo in datos.groupby(['emp', 'tipo'], sort=False, observed=True):
+            grupo = grupo.sort_values('inicio')
+            self._entradas[(emp_id, tipo)] = {
+                'inicio': grupo['inicio'].to_numpy(),
+                'fin': grupo['fin'].to_numpy(),
+                'registro': grupo['registro'].to_numpy(),
+                'por_año': grupo['registro'].dt.year.value_counts().to_dict(),
+                'total': len(grupo),
+                'ultimo_fin': grupo['fin'].max()
+            }
+
+    def total(self, emp_id, tipo):
+        entrada = self._entradas.get((emp_id, tipo))
+        return entrada['total'] if entrada else 0
+
+    def en_año(self, emp_id, tipo, año):
+        entrada = self._entradas.get((emp_id, tipo))
+        return entrada['por_año'].get(año, 0) if entrada else 0
+
+    def ultimo_fin(self, emp_id, tipo):
+        entrada = self._entradas.get((emp_id, tipo))
+        return entrada['ultimo_fin'] if entrada else pd.NaT
+
+# hoja -> (columna inicio, columna fin, tipo fijo o None para usar 'Tipo Permiso')
+COLUMNAS_AUSENCIAS = {
+    'Solicitudes': ('Fecha Inicio', 'Fecha Fin', None),
+    'Incapacidades': ('Fecha Inicio', 'Fecha Termino', 'Incapacidad'),
+}
+
+def tabla_ausencias(df_sol, df_incap):
+    """Une solicitudes e incapacidades (ya normalizadas) en una tabla (inicio, fin, nombre, tipo)"""
+    partes = []
+    for nombre_hoja, df in (('Solicitudes', df_sol), ('Incapacidades', df_incap)):
+        col_inicio, col_fin, tipo_fijo = COLUMNAS_AUSENCIAS[nombre_hoja]
+        if len(df) == 0:
+            continue
+        partes.append(pd.DataFrame({
+            'inicio': df[col_inicio].dt.normalize(),
+            'fin': df[col_fin].dt.normalize(),
+            'nombre': df['Nombre Completo'],
+            'tipo': tipo_fijo if tipo_fijo else df['Tipo Permiso'].astype(object)
+        }))
+    if not partes:
+        return pd.DataFrame({'inicio': pd.Series(dtype='datetime64[ns]'), 'fin': pd.Series(dtype='datetime64[ns]'),
+                             'nombre': pd.Series(dtype=object), 'tipo': pd.Series(dtype=object)})
+    ausencias = pd.concat(partes, ignore_index=True).dropna(subset=['inicio', 'fin'])
+    return ausencias[ausencias['fin'] >= ausencias['inicio']].reset_index(drop=True)
+
+class OcupacionDiaria:
+    """Empleados ausentes por día (solicitudes + incapacidades), indexado por fecha.
+
+    El conteo diario se arma con un barrido sobre los extremos de cada intervalo
+    (+1 al inicio, -1 después del fin y suma acumulada), así que consultar un
+    día es una lectura del arreglo. `agregar_registro` permite actualizarlo
+    cuando se escribe una fila nueva sin reconstruirlo.
+
+    El estado (origen, conteo, por_dia) es una sola tupla que nunca se modifica:
+    `agregar` arma la siguiente y la reemplaza en una asignación, así que las
+    sesiones que consultan al mismo tiempo ven el estado anterior o el nuevo.
+    """
+
+    def __init__(self, df_sol, df_incap):
+        ausencias = tabla_ausencias(df_sol, df_incap)
+        por_dia = {}
+        if len(ausencias) == 0:
+            self._estado = (pd.Timestamp(datetime.now().date()), np.zeros(0, dtype=np.int32), por_dia)
+            return
+
+        origen = ausencias['inicio'].min()
+        desde = (ausencias['inicio'] - origen).dt.days.to_numpy()
+        hasta = (ausencias['fin'] - origen).dt.days.to_numpy()
+        delta = np.zeros(hasta.max() + 2, dtype=np.int32)
+        np.add.at(delta, desde, 1)
+        np.add.at(delta, hasta + 1, -1)
+        conteo = np.cumsum(delta[:-1], dtype=np.int32)
+
+        # Lista de ausentes por día: se expande cada intervalo a sus días
+        duraciones = hasta - desde + 1
+        dias = np.repeat(desde, duraciones) + (np.arange(duraciones.sum()) - np.repeat(np.cumsum(duraciones) - duraciones, duraciones))
+        personas = list(zip(np.repeat(ausencias['nombre'].to_numpy(), duraciones), np.repeat(ausencias['tipo'].to_numpy(), duraciones)))
+        for dia, persona in zip(dias.tolist(), personas):
+            por_dia.setdefault(dia, []).append(persona)
+        self._estado = (origen, conteo, por_dia)
+
+    def ausentes(self, fecha):
+        """Número de ausencias registradas ese día"""
+        origen, conteo, _ = self._estado
+        dia = (pd.Timestamp(fecha).normalize() - origen).days
+        return int(conteo[dia]) if 0 <= dia < len(conteo) else 0
+
+    def empleados(self, fecha):
+        """[(nombre, tipo)] de quienes están ausentes ese día"""
+        origen, _, por_dia = self._estado
+        return por_dia.get((pd.Timestamp(fecha).normalize() - origen).days, [])
+
+    def agregar(self, inicio, fin, nombre, tipo):
+        inicio = pd.Timestamp(inicio).normalize()
+        fin = pd.Timestamp(fin).normalize()
+        if pd.isna(inicio) or pd.isna(fin) or fin < inicio:
+            return
+        origen, conteo, por_dia = self._estado
+        if len(conteo) == 0 or inicio < origen:
+            # Mover el origen hacia atrás para que el nuevo intervalo quepa
+            corrimiento = (origen - inicio).days if len(conteo) else 0
+            conteo = np.concatenate([np.zeros(corrimiento, dtype=np.int32), conteo])
+            por_dia = {dia + corrimiento: lista for dia, lista in por_dia.items()}
+            origen = inicio
+        else:
+            por_dia = dict(por_dia)
+        desde = (inicio - origen).days
+        hasta = (fin - origen).days
+        # Copias nuevas: el arreglo y las listas del estado actual pueden estar leyéndose
+        conteo = np.concatenate([conteo, np.zeros(max(hasta + 1 - len(conteo), 0), dtype=np.int32)])
+        conteo[desde:hasta + 1] += 1
+        for dia in range(desde, hasta + 1):
+            por_dia[dia] = por_dia.get(dia, []) + [(nombre, tipo)]
+        self._estado = (origen, conteo, por_dia)
+
+    def agregar_registro(self, nombre_hoja, registro):
+        """Gancho para AlmacenDatos.derivado: refleja una fila recién escrita (ya normalizada)"""
+        col_inicio, col_fin, tipo_fijo = COLUMNAS_AUSENCIAS[nombre_hoja]
+        self.agregar(
+            registro.get(col_inicio),
+            registro.get(col_fin),
+            registro.get('Nombre Completo'),
+            tipo_fijo or registro.get('Tipo Permiso')
+        )
+
+class IndiceIntervalos:
+    """Consulta de ausencias (solicitudes + incapacidades) que traslapan un rango de fechas.
+
+    Las ausencias se ordenan por fecha de inicio. Ninguna dura más que la más
+    larga registrada, así que las que pueden traslapar [inicio, fin] empiezan
+    entre `inicio - duración máxima` y `fin`; ese tramo se ubica con búsqueda
+    binaria y solo se revisan sus fechas de fin.
+    """
+
+    def __init__(self, df_sol, df_incap):
+        self.ausencias = tabla_ausencias(df_sol, df_incap).sort_values('inicio', kind='stable').reset_index(drop=True)
+        self._inicios = self.ausencias['inicio'].to_numpy()
+        self._fines = self.ausencias['fin'].to_numpy()
+        self._duracion_maxima = (self.ausencias['fin'] - self.ausencias['inicio']).max() if len(self.ausencias) else pd.Timedelta(0)
+
+    def traslapes(self, inicio, fin):
+        """[{'nombre', 'tipo', 'inicio', 'fin'}] de las ausencias que tocan el rango [inicio, fin]"""
+        inicio = pd.Timestamp(inicio).normalize()
+        fin = pd.Timestamp(fin).normalize()
+        desde = np.searchsorted(self._inicios, np.datetime64(inicio - self._duracion_maxima), side='left')
+        hasta = np.searchsorted(self._inicios, np.datetime64(fin), side='right')
+        candidatos = self.ausencias.iloc[desde:hasta]
+        encontrados = candidatos[self._fines[desde:hasta] >= np.datetime64(inicio)]
+        return [
+            {
+                'nombre': aus['nombre'],
+                'tipo': aus['tipo'],
+                'inicio': aus['inicio'].strftime('%d/%m/%Y'),
+                'fin': aus['fin'].strftime('%d/%m/%Y')
+            }
+            for aus in encontrados.to_dict('records')
+        ]
+
+def validar_solicitud(emp_id, tipo, dias, fecha_inicio, df_emp, df_sol, indice=None, directorio=None):
+    """Validación completa de solicitud"""
+    errores = []
+    advertencias = []
+    
+    if indice is None:
+        indice = IndiceLicencias(df_sol)
+    
+    if directorio is not None:
+        emp_info = directorio.empleado(emp_id)
+    else:
+        emp_info = df_emp[df_emp['ID'] == emp_id].iloc[0]
+    dias_disponibles = int(emp_info['DIAS_REALES'])
+    config = NORMATIVA[tipo]
+    año_actual = datetime.now().year
+    
+    # Validar días máximos
+    if dias > config['max_dias']:
+        errores.append(f"❌ Máximo permitido: {config['max_dias']} días")
+    
+    if tipo == 'economico':
+        # Validar días disponibles
+        if dias > dias_disponibles:
+            errores.append(f"❌ Solo tiene {dias_disponibles} días disponibles (solicitó {dias})")
+        
+        # Validar ocasiones en el año
+        if indice.en_año(emp_id, 'economico', año_actual) >= config['max_ocasiones']:
+            errores.append(f"❌ Ya alcanzó el límite de {config['max_ocasiones']} ocasiones en el año")
+        
+        # Validar intervalo 30 días
+        ultima_fecha_fin = indice.ultimo_fin(emp_id, 'economico')
+        if pd.notna(ultima_fecha_fin):
+            dias_diferencia = (pd.to_datetime(fecha_inicio) - ultima_fecha_fin).days
+            
+            if dias_diferencia < 30:
+                fecha_valida = ultima_fecha_fin + timedelta(days=30)
+                errores.append(
+                    f"❌ Debe esperar {30 - dias_diferencia} días más\n"
+                    f"   Último día usado: {ultima_fecha_fin.strftime('%d/%m/%Y')}\n"
+                    f"   Puede solicitar desde: {fecha_valida.strftime('%d/%m/%Y')}"
+                )
+        
+        # Advertencia
+        if dias_disponibles - dias <= 2 and dias <= dias_disponibles:
+            advertencias.append(f"⚠️ Después quedarán {dias_disponibles - dias} días disponibles")
+    
+    # Matrimonio solo una vez EN LA VIDA
+    if tipo == 'matrimonio' and indice.total(emp_id, 'matrimonio') > 0:
+        errores.append("❌ La licencia por matrimonio solo se otorga UNA VEZ en la vida")
+    
+    # Jubilación solo una vez EN LA VIDA
+    if tipo == 'jubilacion' and indice.total(emp_id, 'jubilacion') > 0:
+        errores.append("❌ La licencia por jubilación solo se otorga UNA VEZ (cuando se jubila)")
+    
+    # Examen profesional: máximo 3 veces en la vida (licenciatura, maestría, doctorado)
+    if tipo == 'examen' and indice.total(emp_id, 'examen') >= 3:
+        errores.append("❌ La licencia por examen profesional se otorga máximo 3 veces (licenciatura, maestría, doctorado)")
+    
+    # Mudanza: máximo 2 veces por año (razonable)
+    if tipo == 'mudanza' and indice.en_año(emp_id, 'mudanza', año_actual) >= 2:
+        errores.append("❌ La licencia por mudanza se otorga máximo 2 veces por año")
+    
+    return errores, advertencias
+
+def acumular_incapacidades(df_incap, ventana='anual', fecha_referencia=None, limite=LIMITE_ART44):
+    """Días de incapacidad acumulados por empleado (todos a la vez), separados por tipo.
+
+    ventana='anual' cuenta las incapacidades que inician en el año calendario de
+    la fecha de referencia; ventana='movil' cuenta las que iniciaron en los
+    últimos 365 días. Devuelve una fila por EmpleadoID con los días por tipo,
+    TOTAL, RESTANTES (hasta el límite del Art. 44) y EXCEDE.
+    """
+    referencia = pd.Timestamp(fecha_referencia or datetime.now()).normalize()
+    inicio = df_incap['Fecha Inicio']
+    if ventana == 'movil':
+        en_ventana = (inicio > referencia - pd.Timedelta(days=365)) & (inicio <= referencia)
+    else:
+        en_ventana = inicio.dt.year == referencia.year
+    
+    seleccion = df_incap[en_ventana]
+    dias = seleccion['Dias Totales'].fillna(0)
+    por_tipo = dias.groupby([seleccion['EmpleadoID'], seleccion['Tipo Incapacidad']], observed=True).sum().unstack(fill_value=0)
+    
+    acumulado = por_tipo.reindex(columns=TIPOS_INCAPACIDAD, fill_value=0).astype(int)
+    acumulado['TOTAL'] = por_tipo.sum(axis=1).astype(int)
+    acumulado['RESTANTES'] = limite - acumulado['TOTAL']
+    acumulado['EXCEDE'] = acumulado['TOTAL'] > limite
+    acumulado.index.name = 'EmpleadoID'
+    acumulado.columns.name = None
+    return acumulado
+
+def reporte_riesgo_art44(acumulado, df_emp, umbral=UMBRAL_PRECAUCION_ART44):
+    """Empleados que ya pasan el umbral de precaución, con nombre y RFC, del más cercano al límite al más lejano"""
+    en_riesgo = acumulado[acumulado['TOTAL'] > umbral]
+    empleados = df_emp.set_index('ID')
+    reporte = pd.DataFrame({
+        'EmpleadoID': en_riesgo.index,
+        'Nombre Completo': (empleados['PATERNO'] + ' ' + empleados['MATERNO'] + ' ' + empleados['NOMBRE']).reindex(en_riesgo.index).to_numpy(),
+        'RFC': empleados['RFC'].reindex(en_riesgo.index).to_numpy()
+    })
+    reporte = pd.concat([reporte, en_riesgo.reset_index(drop=True)], axis=1)
+    return reporte.sort_values('RESTANTES').reset_index(drop=True)
+
+def dias_por_mes(df_sol, df_incap):
+    """Reparte cada solicitud e incapacidad en días por mes calendario (tabla larga).
+
+    Devuelve una fila por (registro, mes) con Origen, Fila (índice en su hoja),
+    EmpleadoID, Tipo, Año, Mes y Dias. Una incapacidad del 28 de enero al 17 de
+    febrero queda como 4 días en enero y 17 en febrero. Las solicitudes se
+    reparten según su rango Fecha Inicio–Fecha Fin.
+    """
+    partes = []
+    for origen, df, col_fin, col_tipo in (('Solicitud', df_sol, 'Fecha Fin', 'Tipo Permiso'),
+                                          ('Incapacidad', df_incap, 'Fecha Termino', 'Tipo Incapacidad')):
+        if len(df) == 0:
+            continue
+        partes.append(pd.DataFrame({
+            'Origen': origen,
+            'Fila': df.index,
+            'EmpleadoID': df['EmpleadoID'].to_numpy(),
+            'Tipo': df[col_tipo].astype(object).to_numpy(),
+            'inicio': df['Fecha Inicio'].dt.normalize().to_numpy(),
+            'fin': df[col_fin].dt.normalize().to_numpy()
+        }))
+    columnas = ['Origen', 'Fila', 'EmpleadoID', 'Tipo', 'Año', 'Mes', 'Dias']
+    if not partes:
+        return pd.DataFrame(columns=columnas)
+    
+    rangos = pd.concat(partes, ignore_index=True).dropna(subset=['inicio', 'fin'])
+    rangos = rangos[rangos['fin'] >= rangos['inicio']]
+    
+    # Número de meses que toca cada rango y su mes inicial como entero (año * 12 + mes)
+    mes_inicial = rangos['inicio'].dt.year.to_numpy() * 12 + rangos['inicio'].dt.month.to_numpy() - 1
+    mes_final = rangos['fin'].dt.year.to_numpy() * 12 + rangos['fin'].dt.month.to_numpy() - 1
+    num_meses = mes_final - mes_inicial + 1
+    
+    # Una fila por (rango, mes)
+    expandido = rangos.loc[rangos.index.repeat(num_meses)].reset_index(drop=True)
+    desplazamiento = np.arange(num_meses.sum()) - np.repeat(np.cumsum(num_meses) - num_meses, num_meses)
+    meses = np.repeat(mes_inicial, num_meses) + desplazamiento
+    expandido['Año'] = meses // 12
+    expandido['Mes'] = meses % 12 + 1
+    
+    primer_dia = pd.to_datetime(pd.DataFrame({'year': expandido['Año'], 'month': expandido['Mes'], 'day': 1}))
+    ultimo_dia = primer_dia + pd.offsets.MonthEnd(0)
+    desde = expandido['inicio'].where(expandido['inicio'] > primer_dia, primer_dia)
+    hasta = expandido['fin'].where(expandido['fin'] < ultimo_dia, ultimo_dia)
+    expandido['Dias'] = (hasta - desde).dt.days + 1
+    
+    return expandido[columnas]
+
+def pendientes_por_empleado(df_pend):
+    """{EmpleadoID: DataFrame} con los pendientes en estado 'Pendiente' de cada empleado"""
+    activos = df_pend[df_pend['Estado'] == 'Pendiente']
+    return {emp_id: grupo for emp_id, grupo in activos.groupby('EmpleadoID', sort=False)}
+
+def resumen_pendientes(df_pend):
+    """Por EmpleadoID: NUM_PENDIENTES activos y el texto de la columna PENDIENTES (los dos primeros tipos)"""
+    activos = df_pend[df_pend['Estado'] == 'Pendiente']
+    grupos = activos.groupby('EmpleadoID', sort=False)
+    num = grupos.size()
+    primeros = activos[grupos.cumcount() < 2]
+    tipos = primeros['Tipo_Pendiente'].astype(str).groupby(primeros['EmpleadoID'], sort=False).agg(', '.join)
+    
+    resumen = pd.DataFrame({'NUM_PENDIENTES': num})
+    resumen['PENDIENTES'] = '⚠️ ' + num.astype(str) + ': ' + tipos.reindex(num.index) + np.where(num > 2, '...', '')
+    return resumen
+
+def generar_reporte_completo_mes(df_emp, df_sol, df_incap, df_pend, mes, año, df_dias_mes=None):
+    """Genera un Excel completo con TODO el mes"""
+    output = io.BytesIO()
+    
+    if df_dias_mes is None:
+        df_dias_mes = dias_por_mes(df_sol, df_incap)
+    dias_del_mes = df_dias_mes[(df_dias_mes['Año'] == año) & (df_dias_mes['Mes'] == mes)]
+    dias_incap_mes = dias_del_mes[dias_del_mes['Origen'] == 'Incapacidad']
+    dias_sol_mes = dias_del_mes[dias_del_mes['Origen'] == 'Solicitud']
+    
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # Filtrar datos del mes
+        df_sol_mes = df_sol[
+            (df_sol['Fecha Registro'].dt.month == mes) & 
+            (df_sol['Fecha Registro'].dt.year == año)
+        ]
+        
+        # Incapacidades que tocan el mes, con los días que caen en él (aunque hayan iniciado antes)
+        df_incap_mes = df_incap.loc[dias_incap_mes['Fila']].copy()
+        df_incap_mes['Dias en el Mes'] = dias_incap_mes['Dias'].to_numpy()
+        
+        df_pend_mes = df_pend
+        if len(df_pend_mes) > 0 and 'Fecha_Registro' in df_pend_mes.columns:
+            df_pend_mes = df_pend_mes[
+                (df_pend_mes['Fecha_Registro'].dt.month == mes) & 
+                (df_pend_mes['Fecha_Registro'].dt.year == año)
+            ]
+        
+        # HOJA 1: RESUMEN EJECUTIVO
+        resumen_data = {
+            'INDICADOR': [
+                'Total Solicitudes del Mes',
+                'Total Incapacidades del Mes',
+                'Total Pendientes Registrados',
+                'Días Económicos Solicitados',
+                'Otros Permisos Solicitados',
+                'Total Días Solicitados',
+                'Empleados que Solicitaron',
+                'Pendientes Activos',
+                'Días de Permiso en el Mes',
+                'Días de Incapacidad en el Mes'
+            ],
+            'VALOR': [
+                len(df_sol_mes),
+                len(df_incap_mes),
+                len(df_pend_mes),
+                len(df_sol_mes[df_sol_mes['Tipo Permiso'] == 'economico']) if len(df_sol_mes) > 0 else 0,
+                len(df_sol_mes[df_sol_mes['Tipo Permiso'] != 'economico']) if len(df_sol_mes) > 0 else 0,
+                df_sol_mes['Dias Solicitados'].sum() if len(df_sol_mes) > 0 else 0,
+                df_sol_mes['EmpleadoID'].nunique() if len(df_sol_mes) > 0 else 0,
+                len(df_pend_mes[df_pend_mes['Estado'] == 'Pendiente']) if len(df_pend_mes) > 0 else 0,
+                int(dias_sol_mes['Dias'].sum()),
+                int(dias_incap_mes['Dias'].sum())
+            ]
+        }
+        df_resumen = pd.DataFrame(resumen_data)
+        df_resumen.to_excel(writer, sheet_name='RESUMEN', index=False)
+        
+        # HOJA 2: SOLICITUDES DEL MES
+        if len(df_sol_mes) > 0:
+            df_sol_export = df_sol_mes[[
+                'ID', 'EmpleadoID', 'RFC', 'Nombre Completo',
+                'Tipo Permiso', 'Fecha Inicio', 'Fecha Fin', 'Dias Solicitados',
+                'Motivo', 'Fecha Registro', 'Aprobado Por', 'Registrado Por'
+            ]].copy()
+            df_sol_export.to_excel(writer, sheet_name='Solicitudes', index=False)
+        
+        # HOJA 3: INCAPACIDADES DEL MES
+        if len(df_incap_mes) > 0:
+            df_incap_mes.to_excel(writer, sheet_name='Incapacidades', index=False)
+        
+        # HOJA 4: PENDIENTES DEL MES
+        if len(df_pend_mes) > 0:
+            df_pend_mes.to_excel(writer, sheet_name='Pendientes', index=False)
+        
+        # HOJA 5: ESTADÍSTICAS POR TIPO
+        if len(df_sol_mes) > 0:
+            stats_tipo = df_sol_mes.groupby('Tipo Permiso', observed=True).agg({
+                'ID': 'count',
+                'Dias Solicitados': 'sum',
+                'EmpleadoID': 'nunique'
+            }).rename(columns={
+                'ID': 'Num Solicitudes',
+                'Dias Solicitados': 'Total Dias',
+                'EmpleadoID': 'Num Empleados'
+            })
+            stats_tipo.to_excel(writer, sheet_name='Stats por Tipo')
+        
+        # HOJA 6: ESTADÍSTICAS POR EMPLEADO
+        if len(df_sol_mes) > 0:
+            stats_emp = df_sol_mes.groupby(['EmpleadoID', 'Nombre Completo'], observed=True).agg({
+                'ID': 'count',
+                'Dias Solicitados': 'sum'
+            }).rename(columns={
+                'ID': 'Num Solicitudes',
+                'Dias Solicitados': 'Total Dias'
+            })
+            stats_emp.to_excel(writer, sheet_name='Stats por Empleado')
+        
+        # HOJA 7: ESTADO ACTUAL DE EMPLEADOS
+        df_emp_export = df_emp[['ID', 'RFC', 'PATERNO', 'MATERNO', 'NOMBRE', 'CURP', 'PLAZA', 'DIAS_REALES']].copy()
+        df_emp_export.to_excel(writer, sheet_name='Estado Empleados', index=False)
+    
+    output.seek(0)
+    return output.getvalue()
+
+def crear_trazabilidad_completa(df_sol, df_emp):
+    """Crea un reporte de trazabilidad completo"""
+    if len(df_sol) == 0:
+        return pd.DataFrame()
+    
+    df_traz = df_sol.copy()
+    
+    # Enriquecer con información del empleado
+    df_traz = df_traz.merge(
+        df_emp[['ID', 'PLAZA']],
+        left_on='EmpleadoID',
+        right_on='ID',
+        how='left',
+        suffixes=('', '_emp')
+    )
+    
+    # Ordenar cronológicamente
+    df_traz = df_traz.sort_values('Fecha Registro', ascending=False)
+    
+    # Columnas de trazabilidad
+    columnas_traz = [
+        'Fecha Registro', 'Nombre Completo', 'RFC', 'PLAZA',
+        'Tipo Permiso', 'Fecha Inicio', 'Fecha Fin', 'Dias Solicitados',
+        'Motivo', 'Aprobado Por', 'Registrado Por'
+    ]
+    
+    return df_traz[columnas_traz]
+
+def plegar_texto(texto):
+    """Minúsculas, sin acentos y con espacios simples: 'García  Pérez' -> 'garcia perez'"""
+    descompuesto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ' '.join(''.join(c for c in descompuesto if not unicodedata.combining(c)).split())
+
+class IndiceBusqueda:
+    """Buscador de empleados sin distinguir acentos ni mayúsculas, compartido por todos los cuadros de búsqueda.
+
+    Cada empleado tiene una clave con sus COLUMNAS_BUSQUEDA ya plegadas. Cada
+    palabra del texto buscado se resuelve por separado (el índice de trigramas
+    da los candidatos y solo esos se comparan contra la clave) y el resultado es
+    la intersección, así que 'perez luis' encuentra a PEREZ GOMEZ LUIS.
+    """
+
+    def __init__(self, df_emp, columnas=COLUMNAS_BUSQUEDA):
+        presentes = [col for col in columnas if col in df_emp.columns]
+        textos = df_emp[presentes].fillna('').astype(str).agg(' '.join, axis=1) if presentes else [''] * len(df_emp)
+        self.claves = [plegar_texto(texto) for texto in textos]
+        self._trigramas = {}
+        for pos, clave in enumerate(self.claves):
+            for i in range(len(clave) - 2):
+                self._trigramas.setdefault(clave[i:i + 3], set()).add(pos)
+
+    def _buscar_palabra(self, palabra):
+        if len(palabra) < 3:
+            # Palabras muy cortas: no hay trigramas, se revisan todas las claves
+            candidatos = range(len(self.claves))
+        else:
+            conjuntos = sorted((self._trigramas.get(palabra[i:i + 3], set()) for i in range(len(palabra) - 2)), key=len)
+            candidatos = set.intersection(*conjuntos)
+        return {pos for pos in candidatos if palabra in self.claves[pos]}
+
+    def buscar(self, texto):
+        """Posiciones (en el orden del DataFrame de empleados) de quienes contienen todas las palabras de `texto`"""
+        palabras = sorted(set(plegar_texto(texto).split()), key=len, reverse=True)
+        if not palabras:
+            return np.arange(len(self.claves), dtype=int)
+        encontrados = self._buscar_palabra(palabras[0])
+        for palabra in palabras[1:]:
+            if not encontrados:
+                break
+            encontrados &= self._buscar_palabra(palabra)
+        return np.array(sorted(encontrados), dtype=int)
+
+class DirectorioEmpleados:
+    """Empleados indexados por ID, con las etiquetas de los selectores ya armadas.
+
+    Reemplaza los recorridos de `df_empleados` por búsquedas en diccionario:
+    `empleado(id)` devuelve la fila como dict y las etiquetas se pasan
+    directo como `format_func` de los selectbox.
+    """
+
+    def __init__(self, df_emp):
+        self._filas = {fila['ID']: fila for fila in df_emp.to_dict('records')}
+        self.ids = list(self._filas)
+        self.etiqueta_dias = {}
+        self.etiqueta_rfc = {}
+        for emp_id, e in self._filas.items():
+            nombre = f"{e['PATERNO']} {e['MATERNO']} {e['NOMBRE']}"
+            self.etiqueta_dias[emp_id] = f"{nombre} - {e['PUESTO']} ({int(e['DIAS_REALES'])} días)"
+            self.etiqueta_rfc[emp_id] = f"{nombre} - {e['RFC']}"
+
+    def empleado(self, emp_id):
+        return self._filas[emp_id]
+
+def generar_alertas(df_empleados):
+    """Genera alertas de empleados con pocos días"""
+    alertas = []
+    for _, emp in df_empleados.iterrows():
+        dias = int(emp['DIAS_REALES'])
+        nombre = f"{emp['PATERNO']} {emp['MATERNO']} {emp['NOMBRE']}"
+        
+        if dias == 0:
+            alertas.append({'tipo': 'error', 'mensaje': f"🚫 {nombre} NO tiene días disponibles"})
+        elif dias == 1:
+            alertas.append({'tipo': 'warning', 'mensaje': f"⚠️ {nombre} tiene solo 1 día disponible"})
+        elif dias <= 3:
+            alertas.append({'tipo': 'info', 'mensaje': f"ℹ️ {nombre} tiene {dias} días disponibles"})
+    
+    return alertas
+
+def verificar_fechas_limite():
+    """Recordatorios de fechas límite para propuestas"""
+    zona_mexico = timezone(timedelta(hours=-6))
+    hoy = datetime.now(zona_mexico).date()
+    
+    # CALENDARIO ESTATAL
+    fechas_estatal = {
+        'Q03': datetime(2026, 1, 23).date(),
+        'Q04': datetime(2026, 2, 5).date(),
+        'Q05': datetime(2026, 2, 16).date(),
+        'Q06': datetime(2026, 3, 3).date(),
+        'Q07': datetime(2026, 3, 3).date(),
+        'Q08': datetime(2026, 3, 23).date(),
+        'Q09': datetime(2026, 4, 20).date(),
+        'Q10': datetime(2026, 5, 7).date(),
+        'Q11': datetime(2026, 5, 20).date(),
+        'Q12': datetime(2026, 6, 8).date(),
+        'Q13': datetime(2026, 6, 22).date(),
+        'Q14': datetime(2026, 7, 8).date(),
+        'Q15': datetime(2026, 7, 21).date(),
+        'Q16': datetime(2026, 8, 10).date(),
+        'Q17': datetime(2026, 8, 21).date(),
+        'Q18': datetime(2026, 9, 4).date(),
+        'Q19': datetime(2026, 9, 22).date(),
+        'Q20': datetime(2026, 10, 6).date(),
+        'Q21': datetime(2026, 10, 21).date(),
+        'Q22': datetime(2026, 11, 5).date(),
+    }
+    
+    # CALENDARIO FEDERALIZADO
+    fechas_federal = {
+        'Q02': datetime(2026, 1, 9).date(),
+        'Q03': datetime(2026, 1, 23).date(),
+        'Q04': datetime(2026, 2, 5).date(),
+        'Q05': datetime(2026, 2, 19).date(),
+        'Q06': datetime(2026, 3, 6).date(),
+        'Q07': datetime(2026, 3, 6).date(),
+        'Q08': datetime(2026, 4, 7).date(),
+        'Q09': datetime(2026, 4, 23).date(),
+        'Q10': datetime(2026, 5, 7).date(),
+        'Q11': datetime(2026, 5, 22).date(),
+        'Q12': datetime(2026, 6, 8).date(),
+        'Q13': datetime(2026, 6, 23).date(),
+        'Q14': datetime(2026, 6, 23).date(),
+        'Q15': datetime(2026, 6, 23).date(),
+        'Q16': datetime(2026, 8, 6).date(),
+        'Q17': datetime(2026, 8, 21).date(),
+        'Q18': datetime(2026, 9, 7).date(),
+        'Q19': datetime(2026, 9, 22).date(),
+        'Q20': datetime(2026, 10, 7).date(),
+        'Q21': datetime(2026, 10, 22).date(),
+        'Q22': datetime(2026, 11, 5).date(),
+        'Q23': datetime(2026, 11, 20).date(),
+        'Q24': datetime(2026, 11, 20).date(),
+    }
+    
+    alertas = {'criticas': [], 'proximas': [], 'futuras': []}
+    
+    # ESTATAL
+    for qna, fecha in fechas_estatal.items():
+        dias = (fecha - hoy).days
+        if dias < 0:
+            continue
+        
+        item = {
+            'sistema': 'ESTATAL',
+            'quincena': qna,
+            'fecha': fecha.strftime('%d/%m/%Y'),
+            'dias': dias
+        }
+        
+        if 0 <= dias <= 5:
+            alertas['criticas'].append(item)
+        elif 4 <= dias <= 15:
+            alertas['proximas'].append(item)
+        elif 16 <= dias <= 90:
+            alertas['futuras'].append(item)
+    
+    # FEDERALIZADO
+    for qna, fecha in fechas_federal.items():
+        dias = (fecha - hoy).days
+        if dias < 0:
+            continue
+        
+        item = {
+            'sistema': 'FEDERAL',
+            'quincena': qna,
+            'fecha': fecha.strftime('%d/%m/%Y'),
+            'dias': dias
+        }
+        
+        if 0 <= dias <= 5:
+            alertas['criticas'].append(item)
+        elif 4 <= dias <= 15:
+            alertas['proximas'].append(item)
+        elif 16 <= dias <= 90:
+            alertas['futuras'].append(item)
+    
+    return alertas
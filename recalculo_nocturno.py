@@ -0,0 +1,142 @@
+"""Recálculo nocturno sin navegador: saldos, reportes del mes y alertas.
+
+Escribe en el almacenamiento solo la columna de días disponibles de Empleados;
+los reportes y las alertas quedan como archivos Excel en --salida. La app no
+lee nada de esto: sus sesiones calculan saldos y alertas a partir de las hojas
+(una vez por versión de los datos, compartido entre sesiones).
+
+Uso (por ejemplo desde cron):
+    python recalculo_nocturno.py --credenciales cuenta_servicio.json
+    python recalculo_nocturno.py --credenciales cuenta_servicio.json --mes 9 --año 2026 --salida reportes
+    python recalculo_nocturno.py --credenciales cuenta_servicio.json --sqlite rh_dfc.db
+
+Con --sqlite la base local es el almacenamiento principal y, al terminar, sus
+tablas se exportan a Google Sheets como espejo, en hojas aparte (Espejo_<hoja>).
+El espejo solo se escribe si los secrets de la app ([almacenamiento] motor y
+ruta) indican esa misma base como almacenamiento principal.
+"""
+import argparse
+import json
+import os
+import tomllib
+from datetime import datetime
+
+import pandas as pd
+
+from nucleo_rh import (
+    HOJAS_DATOS, LIMITE_ART44, PREFIJO_ESPEJO, AlmacenDatos, PlanificadorSheets, PoolHojas, ColaEscrituras,
+    AlmacenamientoSheets, AlmacenamientoSQLite, copiar_hojas, conectar_con_credenciales, normalizar_hoja,
+    calcular_saldos, conciliar_dias_disponibles, acumular_incapacidades, reporte_riesgo_art44, dias_por_mes,
+    generar_reporte_completo_mes, crear_trazabilidad_completa, generar_alertas, verificar_fechas_limite
+)
+
+# Hojas que necesita el recálculo (las de documentos no se usan)
+HOJAS_RECALCULO = ['Empleados', 'Solicitudes', 'Incapacidades', 'Pendientes_Empleado']
+
+# Columnas del Excel de alertas
+COLUMNAS_ALERTAS = ['Fecha Calculo', 'Categoria', 'Nivel', 'Detalle']
+
+def filas_de_alertas(df_emp, acumulado, fechas_limite, fecha_calculo):
+    """Todas las alertas en una tabla plana"""
+    filas = []
+    for alerta in generar_alertas(df_emp):
+        filas.append([fecha_calculo, 'Días económicos', alerta['tipo'], alerta['mensaje']])
+
+    for reg in reporte_riesgo_art44(acumulado, df_emp).to_dict('records'):
+        nivel = 'error' if reg['EXCEDE'] else 'warning'
+        filas.append([fecha_calculo, 'Artículo 44', nivel,
+                      f"{reg['Nombre Completo']} ({reg['RFC']}): {reg['TOTAL']} de {LIMITE_ART44} días"])
+
+    for nivel, grupo in (('error', 'criticas'), ('warning', 'proximas'), ('info', 'futuras')):
+        for item in fechas_limite[grupo]:
+            filas.append([fecha_calculo, 'Fecha límite', nivel,
+                          f"{item['sistema']} {item['quincena']}: {item['fecha']} (faltan {item['dias']} días)"])
+    return filas
+
+def sqlite_es_principal(ruta_secrets, ruta_sqlite):
+    """True si los secrets de la app configuran `ruta_sqlite` como almacenamiento principal"""
+    try:
+        with open(ruta_secrets, 'rb') as archivo:
+            config = tomllib.load(archivo).get('almacenamiento', {})
+    except (OSError, tomllib.TOMLDecodeError):
+        return False
+    return (config.get('motor') == 'sqlite'
+            and os.path.abspath(config.get('ruta', 'rh_dfc.db')) == os.path.abspath(ruta_sqlite))
+
+def main():
+    hoy = datetime.now()
+    parser = argparse.ArgumentParser(description="Recalcula saldos, reportes y alertas sin abrir la app")
+    parser.add_argument('--credenciales', default=os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'),
+                        help="JSON de la cuenta de servicio (por defecto GOOGLE_APPLICATION_CREDENTIALS)")
+    parser.add_argument('--mes', type=int, default=hoy.month, help="Mes del reporte (por defecto el actual)")
+    parser.add_argument('--año', type=int, default=hoy.year, help="Año del reporte (por defecto el actual)")
+    parser.add_argument('--salida', default='reportes', help="Carpeta donde se guardan los Excel")
+    parser.add_argument('--sqlite', help="Base SQLite a usar como almacenamiento principal (Sheets queda como espejo)")
+    parser.add_argument('--secrets', default=os.path.join('.streamlit', 'secrets.toml'),
+                        help="secrets.toml de la app, para confirmar que SQLite es el almacenamiento principal")
+    parser.add_argument('--sin-escribir', action='store_true', help="Calcula todo pero no escribe en ningún almacenamiento")
+    args = parser.parse_args()
+
+    if not args.credenciales:
+        parser.error("Indica --credenciales o la variable GOOGLE_APPLICATION_CREDENTIALS")
+    with open(args.credenciales, encoding='utf-8') as archivo:
+        info = json.load(archivo)
+
+    pool = PoolHojas(lambda: conectar_con_credenciales(info), PlanificadorSheets())
+    sheets = AlmacenamientoSheets(pool)
+    almacenamiento = sheets
+    if args.sqlite:
+        almacenamiento = AlmacenamientoSQLite(args.sqlite)
+        faltantes = [nombre for nombre in HOJAS_DATOS if not almacenamiento.existe(nombre)]
+        if faltantes:
+            copiar_hojas(sheets, almacenamiento, faltantes)
+            print(f"Importadas de Google Sheets: {', '.join(faltantes)}")
+
+    almacen = AlmacenDatos(normalizar=normalizar_hoja)
+    datos = almacen.obtener_varias(HOJAS_RECALCULO, almacenamiento.leer)
+    print(f"Hojas cargadas en {almacen.tiempo_ultima_carga:.2f} s")
+
+    df_emp = datos['Empleados'].copy(deep=False)
+    df_emp['DIAS_REALES'] = calcular_saldos(datos['Empleados'], datos['Solicitudes'])['DIAS_REALES'].to_numpy()
+
+    # 1. Días disponibles en la hoja de Empleados (solo las celdas que cambiaron)
+    ediciones = conciliar_dias_disponibles(datos['Empleados'], datos['Solicitudes'])
+    if ediciones and not args.sin_escribir:
+        cola = ColaEscrituras(almacenamiento, almacen)
+        escritura = cola.editar_celdas('Empleados', ediciones)
+        cola.vaciar('Empleados')
+        escritura.result()
+    print(f"Días disponibles: {len(ediciones)} celda(s) por actualizar")
+
+    # 2. Reporte completo del mes y trazabilidad
+    os.makedirs(args.salida, exist_ok=True)
+    reporte = generar_reporte_completo_mes(
+        df_emp, datos['Solicitudes'], datos['Incapacidades'], datos['Pendientes_Empleado'], args.mes, args.año,
+        dias_por_mes(datos['Solicitudes'], datos['Incapacidades'])
+    )
+    ruta_reporte = os.path.join(args.salida, f"reporte_completo_{args.año}_{args.mes:02d}.xlsx")
+    with open(ruta_reporte, 'wb') as archivo:
+        archivo.write(reporte)
+
+    df_trazabilidad = crear_trazabilidad_completa(datos['Solicitudes'], df_emp)
+    ruta_trazabilidad = os.path.join(args.salida, f"trazabilidad_{hoy.strftime('%Y%m%d')}.xlsx")
+    df_trazabilidad.to_excel(ruta_trazabilidad, index=False)
+    print(f"Reportes guardados en {ruta_reporte} y {ruta_trazabilidad}")
+
+    # 3. Alertas: días económicos, Artículo 44 y fechas límite
+    acumulado = acumular_incapacidades(datos['Incapacidades'])
+    filas = filas_de_alertas(df_emp, acumulado, verificar_fechas_limite(), hoy.strftime('%Y-%m-%d %H:%M:%S'))
+    ruta_alertas = os.path.join(args.salida, f"alertas_{hoy.strftime('%Y%m%d')}.xlsx")
+    pd.DataFrame(filas, columns=COLUMNAS_ALERTAS).to_excel(ruta_alertas, index=False)
+    print(f"Alertas: {len(filas)} (guardadas en {ruta_alertas})")
+
+    # 4. Espejo: con SQLite como principal, Google Sheets recibe una copia completa en hojas aparte
+    if args.sqlite and not args.sin_escribir:
+        if sqlite_es_principal(args.secrets, args.sqlite):
+            copiar_hojas(almacenamiento, sheets, HOJAS_DATOS, prefijo=PREFIJO_ESPEJO)
+            print(f"Espejo exportado a Google Sheets: {', '.join(PREFIJO_ESPEJO + nombre for nombre in HOJAS_DATOS)}")
+        else:
+            print(f"Espejo omitido: {args.secrets} no configura {args.sqlite} como almacenamiento principal")
+
+if __name__ == '__main__':
+    main()
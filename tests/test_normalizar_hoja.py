@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('gspread')
+pytest.importorskip('google.auth')
+
+from nucleo_rh import normalizar_hoja
+
+
+def test_compacto_con_dias_fuera_de_rango_usa_int64():
+    # Un año mal capturado en la fecha de término deja 36525 días de incapacidad
+    df = pd.DataFrame({'ID': [1, 2], 'EmpleadoID': [10, 11], 'Dias Totales': [3, 36525]})
+    tipado = normalizar_hoja('Incapacidades', df, compacto=True)
+    assert str(tipado['Dias Totales'].dtype) == 'Int64'
+    assert tipado['Dias Totales'].tolist() == [3, 36525]
+    assert str(tipado['ID'].dtype) == 'Int32'
+
+
+def test_compacto_en_rango_usa_enteros_pequenos():
+    df = pd.DataFrame({'ID': [1, 2], 'Dias Solicitados': [1, '']})
+    tipado = normalizar_hoja('Solicitudes', df, compacto=True)
+    assert str(tipado['Dias Solicitados'].dtype) == 'Int16'
+    assert str(tipado['ID'].dtype) == 'Int32'
+
+
+def test_valores_que_no_caben_en_int64_quedan_vacios():
+    df = pd.DataFrame({'Dias Totales': [1e30, 5]})
+    tipado = normalizar_hoja('Incapacidades', df, compacto=True)
+    assert tipado['Dias Totales'].isna().tolist() == [True, False]